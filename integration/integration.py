@@ -1,19 +1,26 @@
 #!/usr/bin/env python3
 
+import collections
+import concurrent.futures
 import datetime
+import hashlib
+import io
+import json
 import logging
 import os
+import queue
 import re
 import threading
-import multiprocessing
+import time
 
 import dateutil.parser
-import psycopg2
 import psycopg2.extras
 
 from flask import Flask, request, jsonify
 from jira_patch import JIRA, CustomFieldType, CustomFieldSearcherKey
-from pepper_patch import Pepper
+from pepper_patch import PepperSession
+from psycopg2_patch import ConnectionPool
+from versions import sort_versions
 
 
 # Salt connection settings
@@ -22,6 +29,37 @@ SALT_EAUTH = os.getenv('SALT_EAUTH', 'auto')
 SALT_USERNAME = os.getenv('SALT_USERNAME', 'integration')
 SALT_PASSWORD = os.getenv('SALT_PASSWORD', 'integration')
 
+# Salt dispatch settings
+SALT_DISPATCH_MODE = os.getenv('SALT_DISPATCH_MODE', 'list')
+SALT_DISPATCH_CHUNK_SIZE = int(os.getenv('SALT_DISPATCH_CHUNK_SIZE', '500'))
+SALT_COALESCE_WINDOW = float(os.getenv('SALT_COALESCE_WINDOW', '0'))
+
+# Salt rollout settings
+SALT_ROLLOUT_MAX_IN_FLIGHT = int(os.getenv('SALT_ROLLOUT_MAX_IN_FLIGHT', '50'))
+SALT_ROLLOUT_FAILURE_THRESHOLD = os.getenv('SALT_ROLLOUT_FAILURE_THRESHOLD', '0')
+
+# Salt job completion settings
+SALT_COMPLETION_MODE = os.getenv('SALT_COMPLETION_MODE', 'events')
+SALT_EVENTS_TIMEOUT = float(os.getenv('SALT_EVENTS_TIMEOUT', '3600'))
+SALT_EVENTS_READ_TIMEOUT = float(os.getenv('SALT_EVENTS_READ_TIMEOUT', '300'))
+SALT_EVENTS_SWEEP_INTERVAL = float(os.getenv('SALT_EVENTS_SWEEP_INTERVAL', '10'))
+SALT_EVENTS_RETRY_INTERVAL = float(os.getenv('SALT_EVENTS_RETRY_INTERVAL', '10'))
+SALT_EVENTS_UNMATCHED_TTL = float(os.getenv('SALT_EVENTS_UNMATCHED_TTL', '60'))
+SALT_EVENTS_UNMATCHED_SIZE = int(os.getenv('SALT_EVENTS_UNMATCHED_SIZE', '1000'))
+
+# Salt pillar cache settings
+SALT_PILLAR_CACHE = os.getenv('SALT_PILLAR_CACHE', 'true').lower() in ('1', 'true', 'yes')
+SALT_PILLAR_CACHE_CLEAR_ALL = int(os.getenv('SALT_PILLAR_CACHE_CLEAR_ALL', '500'))
+
+# Sync collection settings
+SYNC_COLLECTION_MODE = os.getenv('SYNC_COLLECTION_MODE', 'stream')
+SYNC_CHUNK_SIZE = int(os.getenv('SYNC_CHUNK_SIZE', '50'))
+SYNC_TIMEOUT = int(os.getenv('SYNC_TIMEOUT', '60'))
+SYNC_GROUP_MINIONS = os.getenv('SYNC_GROUP_MINIONS', 'true').lower() in ('1', 'true', 'yes')
+SYNC_REPRESENTATIVE_ATTEMPTS = int(os.getenv('SYNC_REPRESENTATIVE_ATTEMPTS', '3'))
+SYNC_PIPELINE_TIMEOUT = float(os.getenv('SYNC_PIPELINE_TIMEOUT', '1800'))
+SYNC_REQUEST_TIMEOUT = float(os.getenv('SYNC_REQUEST_TIMEOUT', '300'))
+
 # PostgreSQL connection settings
 POSTGRES_HOST = os.getenv('POSTGRES_HOST', 'postgres')
 POSTGRES_PORT = int(os.getenv('POSTGRES_PORT', '5432'))
@@ -36,10 +74,37 @@ POSTGRES_AUTH = {
     'dbname': POSTGRES_DB,
 }
 
+# PostgreSQL connection pool settings
+POSTGRES_POOL_MIN_SIZE = int(os.getenv('POSTGRES_POOL_MIN_SIZE', '2'))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv('POSTGRES_POOL_MAX_SIZE', '10'))
+POSTGRES_POOL_TIMEOUT = float(os.getenv('POSTGRES_POOL_TIMEOUT', '30'))
+POSTGRES_POOL_CHECK_INTERVAL = float(os.getenv('POSTGRES_POOL_CHECK_INTERVAL', '30'))
+
+# Job queue settings
+JOBS_ASYNC_MODE = os.getenv('JOBS_ASYNC_MODE', 'false').lower() in ('1', 'true', 'yes')
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '2'))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '5'))
+JOBS_STALE_TIMEOUT = float(os.getenv('JOBS_STALE_TIMEOUT', '600'))
+JOBS_HEARTBEAT_INTERVAL = float(os.getenv('JOBS_HEARTBEAT_INTERVAL', '60'))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '3'))
+
+# Bulk operation settings
+BULK_MAX_OPERATIONS = int(os.getenv('BULK_MAX_OPERATIONS', '500'))
+
+# Scheduler settings
+SCHEDULER_INTERVAL = float(os.getenv('SCHEDULER_INTERVAL', '30'))
+SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '5000'))
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv('SCHEDULER_MAX_ATTEMPTS', '3'))
+
 # Jira connection settings
 JIRA_HOST = os.getenv('JIRA_HOST', 'https://jira.atlassian.com')
 JIRA_USERNAME = os.getenv('JIRA_USERNAME', 'jira')
 JIRA_PASSWORD = os.getenv('JIRA_PASSWORD', 'jira')
+JIRA_TRANSITION_CACHE_TTL = float(os.getenv('JIRA_TRANSITION_CACHE_TTL', '3600'))
+JIRA_SYNC_MODE = os.getenv('JIRA_SYNC_MODE', 'reconcile')
+JIRA_WORKERS = int(os.getenv('JIRA_WORKERS', '8'))
+JIRA_REQUEST_RATE = float(os.getenv('JIRA_REQUEST_RATE', '10'))
+JIRA_OPTION_MIRROR = os.getenv('JIRA_OPTION_MIRROR', 'true').lower() in ('1', 'true', 'yes')
 
 # Jira field settings
 JIRA_ALL_MINIONS_FIELD = 'Minions'
@@ -67,18 +132,45 @@ SELECT_INSTALL_PACKAGES_QUERY = (
     'WHERE itsm_id = %s'
 )
 
-INSERT_INSTALL_PACKAGES_QUERY = (
+INSERT_INSTALL_PACKAGES_BULK_QUERY = (
     'INSERT INTO install_packages '
     '(itsm_id, minion_id, package_name, package_version, after) '
-    'VALUES (%s, %s, %s, %s, %s) '
+    'SELECT itsm_id, minion_id, package_name, package_version, after '
+    'FROM unnest(%s::VARCHAR[], %s::VARCHAR[], %s::VARCHAR[], %s::VARCHAR[], %s::TIMESTAMP[]) '
+    'AS requests (itsm_id, minion_id, package_name, package_version, after) '
+    'WHERE char_length(itsm_id) BETWEEN 1 AND 64 '
+    'AND char_length(minion_id) BETWEEN 1 AND 64 '
+    'AND char_length(package_name) BETWEEN 1 AND 128 '
+    'AND (package_version IS NULL OR char_length(package_version) <= 128) '
+    'AND after IS NOT NULL '
     'ON CONFLICT (itsm_id, minion_id, package_name, package_version) '
-    'DO UPDATE SET after = EXCLUDED.after'
+    'DO UPDATE SET after = EXCLUDED.after, reverted = FALSE '
+    'RETURNING itsm_id, minion_id'
 )
 
 UPDATE_INSTALL_PACKAGES_QUERY = (
     'UPDATE install_packages '
     'SET reverted = TRUE '
-    'WHERE itsm_id = %s'
+    'WHERE itsm_id = %s AND reverted = FALSE '
+    'RETURNING minion_id, package_name, package_version, after'
+)
+
+REVERT_INSTALL_PACKAGES_QUERY = (
+    'UPDATE install_packages '
+    'SET reverted = TRUE '
+    'WHERE itsm_id = %s AND minion_id = ANY(%s) AND package_name = %s '
+    'AND package_version IS NOT DISTINCT FROM %s AND after = %s'
+)
+
+RESTORE_INSTALL_PACKAGES_QUERY = (
+    'UPDATE install_packages '
+    'SET reverted = FALSE '
+    'FROM unnest(%s::VARCHAR[], %s::VARCHAR[], %s::VARCHAR[], %s::TIMESTAMP[]) '
+    'AS requests (minion_id, package_name, package_version, after) '
+    'WHERE install_packages.itsm_id = %s AND install_packages.minion_id = requests.minion_id '
+    'AND install_packages.package_name = requests.package_name '
+    'AND install_packages.package_version IS NOT DISTINCT FROM requests.package_version '
+    'AND install_packages.after = requests.after'
 )
 
 INSERT_REBOOT_REQUESTS_QUERY = (
@@ -87,44 +179,407 @@ INSERT_REBOOT_REQUESTS_QUERY = (
     'VALUES (%s, %s, %s)'
 )
 
+INSERT_JOB_RETURNS_QUERY = (
+    'INSERT INTO job_returns '
+    '(jid, minion_id, itsm_id, operation) '
+    'SELECT jid, minion_id, %s, %s '
+    'FROM unnest(%s::VARCHAR[], %s::VARCHAR[]) AS returns (jid, minion_id) '
+    'ON CONFLICT (jid, minion_id, itsm_id) '
+    'DO NOTHING'
+)
+
+SELECT_PENDING_JOB_RETURNS_QUERY = (
+    'SELECT jid, minion_id, operation '
+    'FROM job_returns '
+    'WHERE status = \'pending\''
+)
+
+SELECT_JOB_RETURNS_QUERY = (
+    'SELECT count(*) '
+    'FROM job_returns '
+    'WHERE itsm_id = %s AND status = \'pending\''
+)
+
+UPDATE_JOB_RETURNS_QUERY = (
+    'UPDATE job_returns '
+    'SET status = %s, returned_at = NOW() '
+    'WHERE jid = %s AND minion_id = %s AND status = \'pending\' AND (operation <> \'reboot\' OR %s <> \'succeeded\') '
+    'RETURNING itsm_id'
+)
+
+UPDATE_REBOOT_JOB_RETURNS_QUERY = (
+    'UPDATE job_returns '
+    'SET status = \'succeeded\', returned_at = NOW() '
+    'WHERE minion_id = %s AND status = \'pending\' AND operation = \'reboot\' '
+    'RETURNING itsm_id'
+)
+
+UPDATE_STALE_JOB_RETURNS_QUERY = (
+    'UPDATE job_returns '
+    'SET status = \'timeout\', returned_at = NOW() '
+    'WHERE status = \'pending\' AND created_at < NOW() - make_interval(secs => %s) '
+    'RETURNING itsm_id'
+)
+
+FINALIZE_JOB_RETURNS_QUERY = (
+    'UPDATE job_returns '
+    'SET finalized_at = NOW() '
+    'WHERE itsm_id = %s AND finalized_at IS NULL '
+    'AND NOT EXISTS (SELECT 1 FROM job_returns WHERE itsm_id = %s AND status = \'pending\') '
+    'RETURNING operation, minion_id, status'
+)
+
+INSERT_ROLLOUT_WAVES_QUERY = (
+    'INSERT INTO rollout_waves '
+    '(job_id, itsm_id, operation, wave, minion_ids) '
+    'VALUES (%s, %s, %s, %s, %s) '
+    'RETURNING id'
+)
+
+START_ROLLOUT_WAVES_QUERY = (
+    'UPDATE rollout_waves '
+    'SET status = \'running\', started_at = NOW() '
+    'WHERE id = %s'
+)
+
+FINISH_ROLLOUT_WAVES_QUERY = (
+    'UPDATE rollout_waves '
+    'SET status = %s, successes = %s, failures = %s, finished_at = NOW() '
+    'WHERE id = %s'
+)
+
+SKIP_ROLLOUT_WAVES_QUERY = (
+    'UPDATE rollout_waves '
+    'SET status = \'skipped\', finished_at = NOW() '
+    'WHERE id = ANY(%s::INTEGER[])'
+)
+
+PROMOTE_EFFECTIVE_PACKAGES_QUERY = (
+    'INSERT INTO scheduled_runs '
+    '(minion_id) '
+    'SELECT promote_effective_packages() '
+    'ON CONFLICT (minion_id) '
+    'DO UPDATE SET attempts = 0, requested_at = EXCLUDED.requested_at '
+    'RETURNING minion_id'
+)
+
+CLAIM_SCHEDULED_RUNS_QUERY = (
+    'SELECT minion_id '
+    'FROM scheduled_runs '
+    'ORDER BY requested_at '
+    'LIMIT %s '
+    'FOR UPDATE SKIP LOCKED'
+)
+
+UPDATE_SCHEDULED_RUNS_QUERY = (
+    'UPDATE scheduled_runs '
+    'SET attempts = attempts + 1 '
+    'WHERE minion_id = ANY(%s)'
+)
+
+DELETE_SCHEDULED_RUNS_QUERY = (
+    'DELETE FROM scheduled_runs '
+    'WHERE minion_id = ANY(%s) OR attempts >= %s'
+)
+
 SELECT_MINIONS_QUERY = (
     'SELECT minion_id '
     'FROM minions '
     'WHERE operating_system = %s'
 )
 
-INSERT_MINIONS_QUERY = (
-    'INSERT INTO minions '
-    '(minion_id, operating_system) '
-    'VALUES (%s, %s) '
-    'ON CONFLICT (minion_id) '
-    'DO UPDATE SET operating_system = EXCLUDED.operating_system, last_seen = NOW()'
-)
-
 SELECT_AVAILABLE_PACKAGES_QUERY = (
     'SELECT package_name, package_version '
     'FROM available_packages '
     'WHERE operating_system = %s'
 )
 
-INSERT_AVAILABLE_PACKAGES_QUERY = (
+CREATE_STAGING_TABLES_QUERY = (
+    'CREATE TEMPORARY TABLE staging_minions '
+    '(minion_id VARCHAR(64) NOT NULL, operating_system VARCHAR(64) NOT NULL) '
+    'ON COMMIT DROP; '
+    'CREATE TEMPORARY TABLE staging_available_packages '
+    '(operating_system VARCHAR(64) NOT NULL, package_name VARCHAR(128) NOT NULL, package_version VARCHAR(128)) '
+    'ON COMMIT DROP'
+)
+
+COPY_STAGING_MINIONS_QUERY = (
+    'COPY staging_minions '
+    '(minion_id, operating_system) '
+    'FROM STDIN'
+)
+
+COPY_STAGING_AVAILABLE_PACKAGES_QUERY = (
+    'COPY staging_available_packages '
+    '(operating_system, package_name, package_version) '
+    'FROM STDIN'
+)
+
+MERGE_STAGING_MINIONS_QUERY = (
+    'INSERT INTO minions '
+    '(minion_id, operating_system) '
+    'SELECT DISTINCT ON (minion_id) minion_id, operating_system '
+    'FROM staging_minions '
+    'ORDER BY minion_id '
+    'ON CONFLICT (minion_id) '
+    'DO UPDATE SET operating_system = EXCLUDED.operating_system, last_seen = NOW()'
+)
+
+MERGE_STAGING_AVAILABLE_PACKAGES_QUERY = (
     'INSERT INTO available_packages '
     '(operating_system, package_name, package_version) '
-    'VALUES (%s, %s, %s)'
+    'SELECT DISTINCT staging.operating_system, staging.package_name, staging.package_version '
+    'FROM staging_available_packages AS staging '
+    'WHERE NOT EXISTS ('
+    'SELECT 1 FROM available_packages '
+    'WHERE available_packages.operating_system = staging.operating_system '
+    'AND available_packages.package_name = staging.package_name '
+    'AND available_packages.package_version = staging.package_version'
+    ') '
     'ON CONFLICT (operating_system, package_name, package_version) '
     'DO NOTHING'
 )
 
+INSERT_JOBS_QUERY = (
+    'INSERT INTO jobs '
+    '(operation, itsm_id, payload) '
+    'VALUES (%s, %s, %s) '
+    'RETURNING id'
+)
+
+SELECT_JOBS_QUERY = (
+    'SELECT id, operation, itsm_id, status, stage, result, status_code, attempts, '
+    'created_at, started_at, finished_at '
+    'FROM jobs '
+    'WHERE id = %s'
+)
+
+CLAIM_JOBS_QUERY = (
+    'UPDATE jobs '
+    'SET status = \'running\', started_at = NOW(), updated_at = NOW(), attempts = attempts + 1 '
+    'WHERE id = ('
+    'SELECT id FROM jobs '
+    'WHERE status = \'queued\' '
+    'OR (status = \'running\' AND updated_at < NOW() - make_interval(secs => %s) AND attempts < %s) '
+    'ORDER BY created_at '
+    'LIMIT 1 '
+    'FOR UPDATE SKIP LOCKED'
+    ') '
+    'RETURNING id, operation, payload'
+)
+
+UPDATE_JOBS_STAGE_QUERY = (
+    'UPDATE jobs '
+    'SET stage = %s, updated_at = NOW() '
+    'WHERE id = %s'
+)
+
+HEARTBEAT_JOBS_QUERY = (
+    'UPDATE jobs '
+    'SET updated_at = NOW() '
+    'WHERE id = %s AND status = \'running\''
+)
+
+UPDATE_JOBS_RESULT_QUERY = (
+    'UPDATE jobs '
+    'SET status = %s, result = %s, status_code = %s, updated_at = NOW(), finished_at = NOW() '
+    'WHERE id = %s'
+)
+
+UPDATE_STALE_JOBS_QUERY = (
+    'UPDATE jobs '
+    'SET status = \'failed\', updated_at = NOW(), finished_at = NOW() '
+    'WHERE status = \'running\' AND updated_at < NOW() - make_interval(secs => %s) AND attempts >= %s'
+)
+
+SELECT_SYNC_FINGERPRINTS_QUERY = (
+    'SELECT stage, fingerprint '
+    'FROM sync_fingerprints'
+)
+
+INSERT_SYNC_FINGERPRINTS_QUERY = (
+    'INSERT INTO sync_fingerprints '
+    '(stage, fingerprint) '
+    'VALUES (%s, %s) '
+    'ON CONFLICT (stage) '
+    'DO UPDATE SET fingerprint = EXCLUDED.fingerprint, updated_at = NOW()'
+)
+
+SELECT_JIRA_FIELD_CONTEXTS_QUERY = (
+    'SELECT context_id, option_count '
+    'FROM jira_field_contexts '
+    'WHERE field_id = %s'
+)
+
+INSERT_JIRA_FIELD_CONTEXTS_QUERY = (
+    'INSERT INTO jira_field_contexts '
+    '(field_id, context_id) '
+    'VALUES (%s, %s) '
+    'ON CONFLICT (field_id) '
+    'DO UPDATE SET context_id = EXCLUDED.context_id, option_count = NULL, updated_at = NOW() '
+    'WHERE jira_field_contexts.context_id <> EXCLUDED.context_id'
+)
+
+UPDATE_JIRA_FIELD_CONTEXTS_QUERY = (
+    'UPDATE jira_field_contexts '
+    'SET option_count = %s, updated_at = NOW() '
+    'WHERE field_id = %s AND context_id = %s'
+)
+
+INVALIDATE_JIRA_FIELD_CONTEXTS_QUERY = (
+    'UPDATE jira_field_contexts '
+    'SET option_count = NULL, updated_at = NOW() '
+    'WHERE field_id = %s'
+)
+
+DELETE_JIRA_FIELD_CONTEXTS_QUERY = (
+    'DELETE FROM jira_field_contexts '
+    'WHERE field_id = %s'
+)
+
+SELECT_JIRA_FIELD_OPTIONS_QUERY = (
+    'SELECT option_id, value, parent_id, disabled '
+    'FROM jira_field_options '
+    'WHERE field_id = %s AND context_id = %s '
+    'ORDER BY parent_id NULLS FIRST, position'
+)
+
+INSERT_JIRA_FIELD_OPTIONS_QUERY = (
+    'INSERT INTO jira_field_options '
+    '(field_id, context_id, option_id, value, parent_id, position, disabled) '
+    'SELECT %s, %s, option_id, value, parent_id, position, disabled '
+    'FROM unnest(%s::VARCHAR[], %s::VARCHAR[], %s::VARCHAR[], %s::INTEGER[], %s::BOOLEAN[]) '
+    'AS options (option_id, value, parent_id, position, disabled)'
+)
+
+DELETE_JIRA_FIELD_OPTIONS_QUERY = (
+    'DELETE FROM jira_field_options '
+    'WHERE field_id = %s'
+)
+
+SELECT_SYNC_STATUS_QUERY = (
+    'SELECT dirty, started_at, finished_at, last_success_at, last_duration, last_result, '
+    'EXISTS (SELECT 1 FROM pg_locks WHERE locktype = \'advisory\' AND classid = 0 AND objid = %s AND granted) '
+    'FROM sync_status '
+    'WHERE id = 1'
+)
+
+REQUEST_SYNC_STATUS_QUERY = (
+    'INSERT INTO sync_status '
+    '(id, dirty, force) '
+    'VALUES (1, TRUE, %s) '
+    'ON CONFLICT (id) '
+    'DO UPDATE SET dirty = TRUE, force = sync_status.force OR EXCLUDED.force'
+)
+
+CLAIM_SYNC_STATUS_QUERY = (
+    'UPDATE sync_status '
+    'SET dirty = FALSE, force = FALSE, started_at = NOW() '
+    'FROM (SELECT force FROM sync_status WHERE id = 1 FOR UPDATE) AS previous '
+    'WHERE id = 1 AND dirty '
+    'RETURNING previous.force'
+)
+
+UPDATE_SYNC_STATUS_QUERY = (
+    'UPDATE sync_status '
+    'SET finished_at = NOW(), last_duration = %s, last_result = %s, '
+    'last_success_at = CASE WHEN %s THEN NOW() ELSE last_success_at END '
+    'WHERE id = 1'
+)
+
+# PostgreSQL statements prepared once per pooled connection
+POSTGRES_STATEMENTS = {
+    'select_install_packages': SELECT_INSTALL_PACKAGES_QUERY,
+    'insert_install_packages_bulk': INSERT_INSTALL_PACKAGES_BULK_QUERY,
+    'update_install_packages': UPDATE_INSTALL_PACKAGES_QUERY,
+    'revert_install_packages': REVERT_INSTALL_PACKAGES_QUERY,
+    'restore_install_packages': RESTORE_INSTALL_PACKAGES_QUERY,
+    'insert_reboot_requests': INSERT_REBOOT_REQUESTS_QUERY,
+    'insert_job_returns': INSERT_JOB_RETURNS_QUERY,
+    'select_pending_job_returns': SELECT_PENDING_JOB_RETURNS_QUERY,
+    'select_job_returns': SELECT_JOB_RETURNS_QUERY,
+    'update_job_returns': UPDATE_JOB_RETURNS_QUERY,
+    'update_reboot_job_returns': UPDATE_REBOOT_JOB_RETURNS_QUERY,
+    'update_stale_job_returns': UPDATE_STALE_JOB_RETURNS_QUERY,
+    'finalize_job_returns': FINALIZE_JOB_RETURNS_QUERY,
+    'insert_rollout_waves': INSERT_ROLLOUT_WAVES_QUERY,
+    'start_rollout_waves': START_ROLLOUT_WAVES_QUERY,
+    'finish_rollout_waves': FINISH_ROLLOUT_WAVES_QUERY,
+    'skip_rollout_waves': SKIP_ROLLOUT_WAVES_QUERY,
+    'promote_effective_packages': PROMOTE_EFFECTIVE_PACKAGES_QUERY,
+    'claim_scheduled_runs': CLAIM_SCHEDULED_RUNS_QUERY,
+    'update_scheduled_runs': UPDATE_SCHEDULED_RUNS_QUERY,
+    'delete_scheduled_runs': DELETE_SCHEDULED_RUNS_QUERY,
+    'select_minions': SELECT_MINIONS_QUERY,
+    'select_available_packages': SELECT_AVAILABLE_PACKAGES_QUERY,
+    'insert_jobs': INSERT_JOBS_QUERY,
+    'select_jobs': SELECT_JOBS_QUERY,
+    'claim_jobs': CLAIM_JOBS_QUERY,
+    'update_jobs_stage': UPDATE_JOBS_STAGE_QUERY,
+    'heartbeat_jobs': HEARTBEAT_JOBS_QUERY,
+    'update_jobs_result': UPDATE_JOBS_RESULT_QUERY,
+    'update_stale_jobs': UPDATE_STALE_JOBS_QUERY,
+    'select_sync_fingerprints': SELECT_SYNC_FINGERPRINTS_QUERY,
+    'insert_sync_fingerprints': INSERT_SYNC_FINGERPRINTS_QUERY,
+    'select_jira_field_contexts': SELECT_JIRA_FIELD_CONTEXTS_QUERY,
+    'insert_jira_field_contexts': INSERT_JIRA_FIELD_CONTEXTS_QUERY,
+    'update_jira_field_contexts': UPDATE_JIRA_FIELD_CONTEXTS_QUERY,
+    'invalidate_jira_field_contexts': INVALIDATE_JIRA_FIELD_CONTEXTS_QUERY,
+    'delete_jira_field_contexts': DELETE_JIRA_FIELD_CONTEXTS_QUERY,
+    'select_jira_field_options': SELECT_JIRA_FIELD_OPTIONS_QUERY,
+    'insert_jira_field_options': INSERT_JIRA_FIELD_OPTIONS_QUERY,
+    'delete_jira_field_options': DELETE_JIRA_FIELD_OPTIONS_QUERY,
+    'select_sync_status': SELECT_SYNC_STATUS_QUERY,
+    'request_sync_status': REQUEST_SYNC_STATUS_QUERY,
+    'claim_sync_status': CLAIM_SYNC_STATUS_QUERY,
+    'update_sync_status': UPDATE_SYNC_STATUS_QUERY,
+}
+
 # Regular expressions
-RE_SPLIT_VERSION = re.compile(r'[\.\-\+\~\:]+')
+RE_COPY_ESCAPE = re.compile(r'[\\\t\n\r]')
+
+# Escape sequences of the PostgreSQL COPY text format
+COPY_ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+
+# PostgreSQL advisory locks held by the process running the sync and the one listening to Salt events,
+# refresh_effective_packages takes two key locks in namespace 21003
+SYNC_LOCK_ID = 21001
+SALT_EVENTS_LOCK_ID = 21002
+
+# Shared Jira client, created on first use
+JIRA_CLIENT = None
+JIRA_LOCK = threading.Lock()
+
+# Jira calls that overlap with other stages of a request
+JIRA_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=JIRA_WORKERS, thread_name_prefix='Jira')
+
+# Minions waiting for a coalesced job, keyed by function and arguments
+COALESCE_BATCHES = {}
+COALESCE_LOCK = threading.Lock()
+
+# Wakes up the job workers of this process when a job is queued
+JOBS_EVENT = threading.Event()
 
-# Multiprocess locks
-SYNC_LOCK = multiprocessing.Lock()
+# Job IDs and rebooting minions with pending returns, only kept by the process listening to Salt events
+TRACKED_JOB_RETURNS = None
 
 # Logging settings
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger('Integration')
 
+# Shared Salt API session
+SALT_SESSION = PepperSession(SALT_URL, SALT_USERNAME, SALT_PASSWORD, SALT_EAUTH)
+
+# Shared PostgreSQL connection pool
+POSTGRES_POOL = ConnectionPool(
+    POSTGRES_POOL_MIN_SIZE,
+    POSTGRES_POOL_MAX_SIZE,
+    timeout=POSTGRES_POOL_TIMEOUT,
+    check_interval=POSTGRES_POOL_CHECK_INTERVAL,
+    statements=POSTGRES_STATEMENTS,
+    **POSTGRES_AUTH,
+)
+
 # Flask settings
 app = Flask('Integration')
 
@@ -136,6 +591,13 @@ def install():
     if body is None:
         return jsonify({'success': False, 'error': 'Expected a valid JSON request body.'}), 400
 
+    params, error = parse_install(body)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    return run_operation('install', params, body)
+
+
+def parse_install(body):
     try:
         # Get request values
         itsm_id = body.get('itsm_id')
@@ -146,98 +608,136 @@ def install():
         after = body.get('after')
         after = isoparse(after) if after else datetime.datetime.now()
 
-         # Validate request values
-        if not itsm_id:
-            return jsonify({'success': False, 'error': 'Expected ITSM ID in field \'itsm_id\'.'}), 400
+        # Validate request values
+        if not itsm_id or not isinstance(itsm_id, str):
+            return None, 'Expected ITSM ID in field \'itsm_id\'.'
         if not minion_ids:
-            return jsonify({'success': False, 'error': 'Expected list of minion IDs in field \'minion_ids\'.'}), 400
+            return None, 'Expected list of minion IDs in field \'minion_ids\'.'
         if not package_name:
-            return jsonify({'success': False, 'error': 'Expected package name in field \'package_name\'.'}), 400
+            return None, 'Expected package name in field \'package_name\'.'
         if not package_version:
-            return jsonify({'success': False, 'error': 'Expected package version in field \'package_version\'.'}), 400
+            return None, 'Expected package version in field \'package_version\'.'
         if not after:
-            return jsonify({'success': False, 'error': 'Expected ISO-formatted datetime in field \'after\'.'}), 400
+            return None, 'Expected ISO-formatted datetime in field \'after\'.'
+        try:
+            rollout = parse_rollout(body.get('rollout'))
+        except ValueError:
+            return None, 'Expected batch size, maximum in-flight count and failure threshold in field \'rollout\'.'
+        if rollout and not is_due(after):
+            return None, 'Rollouts cannot be scheduled in the future.'
         if package_version.lower() in ('remove', 'latest'):
             package_version = package_version.lower()
         package_version = package_version if package_version != 'remove' else None
     except:
-        return jsonify({'success': False, 'error': 'Invalid parameters.'}), 400
+        return None, 'Invalid parameters.'
+
+    params = {
+        'itsm_id': itsm_id,
+        'minion_ids': minion_ids,
+        'package_name': package_name,
+        'package_version': package_version,
+        'after': after,
+        'rollout': rollout,
+    }
+    return params, None
 
+
+def run_install(itsm_id, minion_ids, package_name, package_version, after, rollout=None, job_id=None):
     log.info('Install:%s: Received request to install package %s version %s on %s minions.',
              itsm_id, package_name, package_version, len(minion_ids))
 
-    # Transition issue status to waiting on Jira
+    # Transition issue status to waiting on Jira while the request is inserted into the database, the request is
+    # committed right away so its effective package locks are not held while Jira responds
+    update_job_stage(job_id, 'jira_wait')
     log.info('Install:%s: Transitioning Jira issue status to waiting.', itsm_id)
-    try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
-        jira.transition_issue(itsm_id, 'Wait')
-    except:
-        log.error('Install:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+    waiting = JIRA_EXECUTOR.submit(transition_issue, 'Install', itsm_id, 'Wait')
 
     # Insert data into the database
+    update_job_stage(job_id, 'database')
     successes, failures = {}, []
     log.info('Install:%s: Inserting package management request into the database.', itsm_id)
     try:
-        with psycopg2.connect(**POSTGRES_AUTH) as connection:
-            for minion_id in minion_ids:
-                try:
-                    with connection.cursor() as cursor:
-                        values = (itsm_id, minion_id, package_name, package_version, after)
-                        cursor.execute(INSERT_INSTALL_PACKAGES_QUERY, values)
-                except:
-                    log.error('Install:%s: Failed to insert package management request for %s into the database.',
-                              itsm_id, minion_id, exc_info=True)
-                    failures.append(minion_id)
+        rows = [(itsm_id, minion_id, package_name, package_version, after) for minion_id in minion_ids]
+        with POSTGRES_POOL.connection() as connection:
+            inserted = insert_install_packages(connection, rows)
+        # The request is reverted again when the issue cannot be transitioned
+        if not waiting.result():
+            values = (itsm_id, minion_ids, package_name, package_version, after)
+            compensate_install_packages('Install', itsm_id, 'revert_install_packages', values)
+            return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
+        promote_effective_packages()
+        for minion_id in minion_ids:
+            if (itsm_id, minion_id) not in inserted:
+                log.error('Install:%s: Failed to insert package management request for %s into the database.',
+                          itsm_id, minion_id)
+                failures.append(minion_id)
     except:
         log.error('Install:%s: Failed to communicate with the database.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+        return {'success': False, 'error': 'Failed to communicate with the database.'}, 500
+
+    # Requests that are not due yet are applied by the scheduler once they become effective
+    if not is_due(after):
+        return finish_scheduled('Install', itsm_id, minion_ids, failures, after, job_id)
 
     # Connect to the Salt master using Pepper
+    update_job_stage(job_id, 'salt')
     log.info('Install:%s: Connecting to the Salt master.', itsm_id)
     try:
-        pepper = Pepper(SALT_URL)
-        pepper.login(SALT_USERNAME, SALT_PASSWORD, SALT_EAUTH)
+        pepper = SALT_SESSION.connect()
     except:
         log.error('Install:%s: Failed to connect to the Salt master.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to connect to the Salt master.'}), 500
+        return {'success': False, 'error': 'Failed to connect to the Salt master.'}, 500
+
+    # Clear the cached pillar of the minions whose package requests changed
+    log.info('Install:%s: Clearing cached pillar on the Salt master.', itsm_id)
+    targets = [minion_id for minion_id in minion_ids if minion_id not in failures]
+    invalidate_failures = invalidate_pillar(pepper, targets)
+    for minion_id in targets:
+        if minion_id in invalidate_failures:
+            log.error('Install:%s: Failed to clear cached pillar for %s.', itsm_id, minion_id)
+            failures.append(minion_id)
 
     # Run install packages job
     log.info('Install:%s: Requesting package management job from the Salt master.', itsm_id)
-    for minion_id in minion_ids:
-        if minion_id in failures:
-            continue
-        try:
-            result = pepper.local_async(minion_id, 'state.apply', ('install_packages',))
-            if not result['return'][0]:
-                log.error('Install:%s: Empty response when requesting package management job for %s.',
-                          itsm_id, minion_id, exc_info=True)
-                failures.append(minion_id)
-                continue
-            successes[minion_id] = result['return'][0]['jid']
-        except:
-            log.error('Install:%s: Failed to request package management job for %s.',
-                      itsm_id, minion_id, exc_info=True)
-            failures.append(minion_id)
-            continue
+    targets = [minion_id for minion_id in minion_ids if minion_id not in failures]
+    if rollout:
+        successes, dispatch_failures, waves = run_rollout(pepper, 'install', itsm_id, targets, 'state.apply',
+                                                          ('install_packages',), rollout, job_id)
+    else:
+        successes, dispatch_failures = dispatch_job(pepper, targets, 'state.apply', ('install_packages',),
+                                                    coalesce=True)
+        waves = {}
+    for minion_id in dispatch_failures:
+        log.error('Install:%s: Failed to request package management job for %s.', itsm_id, minion_id)
+    failures.extend(dispatch_failures)
 
     # Send response if there are any failures
     if failures:
         log.info('Install:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
-        return jsonify_clear({'success': False, 'successes': successes, 'failures': failures}), 500
+        return jsonify_clear({'success': False, 'successes': successes, 'failures': failures,
+                              'waves': waves}), 500
+
+    # The event listener completes the issue once all minions returned, rollouts wait for their waves themselves
+    if not rollout and track_job_returns('install', itsm_id, successes):
+        log.info('Install:%s: Finished with %s successes and %s failures, waiting for job returns.',
+                 itsm_id, len(successes), len(failures))
+        return jsonify_clear({'success': True, 'successes': successes, 'failures': failures,
+                              'waves': waves}), 200
 
     # Transition issue status to completed on Jira
+    update_job_stage(job_id, 'jira_complete')
     log.info('Install:%s: Transitioning Jira issue status to completed.', itsm_id)
     try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
+        jira = get_jira()
         jira.transition_issue(itsm_id, 'Complete')
     except:
         log.error('Install:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+        return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
 
     # Send success response
     log.info('Install:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
-    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures})
+    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures,
+                          'waves': waves}), 200
 
 
 @app.route('/remove', methods=['POST'])
@@ -247,6 +747,13 @@ def remove():
     if body is None:
         return jsonify({'success': False, 'error': 'Expected a valid JSON request body.'}), 400
 
+    params, error = parse_remove(body)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    return run_operation('remove', params, body)
+
+
+def parse_remove(body):
     # Get request values
     try:
         itsm_id = body.get('itsm_id')
@@ -257,92 +764,129 @@ def remove():
         after = isoparse(after) if after else datetime.datetime.now()
 
         # Validate request values
-        if not itsm_id:
-            return jsonify({'success': False, 'error': 'Expected ITSM ID in field \'itsm_id\'.'}), 400
+        if not itsm_id or not isinstance(itsm_id, str):
+            return None, 'Expected ITSM ID in field \'itsm_id\'.'
         if not minion_ids:
-            return jsonify({'success': False, 'error': 'Expected list of minion IDs in field \'minion_ids\'.'}), 400
+            return None, 'Expected list of minion IDs in field \'minion_ids\'.'
         if not package_name:
-            return jsonify({'success': False, 'error': 'Expected package name in field \'package_name\'.'}), 400
+            return None, 'Expected package name in field \'package_name\'.'
         if not after:
-            return jsonify({'success': False, 'error': 'Expected ISO-formatted datetime in field \'after\'.'}), 400
+            return None, 'Expected ISO-formatted datetime in field \'after\'.'
+        try:
+            rollout = parse_rollout(body.get('rollout'))
+        except ValueError:
+            return None, 'Expected batch size, maximum in-flight count and failure threshold in field \'rollout\'.'
+        if rollout and not is_due(after):
+            return None, 'Rollouts cannot be scheduled in the future.'
     except:
-        return jsonify({'success': False, 'error': 'Invalid parameters.'}), 400
+        return None, 'Invalid parameters.'
+
+    params = {
+        'itsm_id': itsm_id,
+        'minion_ids': minion_ids,
+        'package_name': package_name,
+        'after': after,
+        'rollout': rollout,
+    }
+    return params, None
+
 
+def run_remove(itsm_id, minion_ids, package_name, after, rollout=None, job_id=None):
     log.info('Remove:%s: Received request to remove package %s on %s minions.',
              itsm_id, package_name, len(minion_ids))
 
-    # Transition issue status to waiting on Jira
+    # Transition issue status to waiting on Jira while the request is inserted into the database, the request is
+    # committed right away so its effective package locks are not held while Jira responds
+    update_job_stage(job_id, 'jira_wait')
     log.info('Remove:%s: Transitioning Jira issue status to waiting.', itsm_id)
-    try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
-        jira.transition_issue(itsm_id, 'Wait')
-    except:
-        log.error('Remove:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+    waiting = JIRA_EXECUTOR.submit(transition_issue, 'Remove', itsm_id, 'Wait')
 
     # Insert data into the database
+    update_job_stage(job_id, 'database')
     successes, failures = {}, []
     log.info('Remove:%s: Inserting package management request into the database.', itsm_id)
     try:
-        with psycopg2.connect(**POSTGRES_AUTH) as connection:
-            for minion_id in minion_ids:
-                try:
-                    with connection.cursor() as cursor:
-                        values = (itsm_id, minion_id, package_name, None, after)
-                        cursor.execute(INSERT_INSTALL_PACKAGES_QUERY, values)
-                except:
-                    log.error('Remove:%s: Failed to insert package management request for %s into the database.',
-                              itsm_id, minion_id, exc_info=True)
-                    failures.append(minion_id)
+        rows = [(itsm_id, minion_id, package_name, None, after) for minion_id in minion_ids]
+        with POSTGRES_POOL.connection() as connection:
+            inserted = insert_install_packages(connection, rows)
+        # The request is reverted again when the issue cannot be transitioned
+        if not waiting.result():
+            values = (itsm_id, minion_ids, package_name, None, after)
+            compensate_install_packages('Remove', itsm_id, 'revert_install_packages', values)
+            return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
+        promote_effective_packages()
+        for minion_id in minion_ids:
+            if (itsm_id, minion_id) not in inserted:
+                log.error('Remove:%s: Failed to insert package management request for %s into the database.',
+                          itsm_id, minion_id)
+                failures.append(minion_id)
     except:
         log.error('Remove:%s: Failed to communicate with the database.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+        return {'success': False, 'error': 'Failed to communicate with the database.'}, 500
+
+    # Requests that are not due yet are applied by the scheduler once they become effective
+    if not is_due(after):
+        return finish_scheduled('Remove', itsm_id, minion_ids, failures, after, job_id)
 
     # Connect to the Salt master using Pepper
+    update_job_stage(job_id, 'salt')
     log.info('Remove:%s: Connecting to the Salt master.', itsm_id)
     try:
-        pepper = Pepper(SALT_URL)
-        pepper.login(SALT_USERNAME, SALT_PASSWORD, SALT_EAUTH)
+        pepper = SALT_SESSION.connect()
     except:
         log.error('Remove:%s: Failed to connect to the Salt master.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to connect to the Salt master.'}), 500
+        return {'success': False, 'error': 'Failed to connect to the Salt master.'}, 500
+
+    # Clear the cached pillar of the minions whose package requests changed
+    log.info('Remove:%s: Clearing cached pillar on the Salt master.', itsm_id)
+    targets = [minion_id for minion_id in minion_ids if minion_id not in failures]
+    invalidate_failures = invalidate_pillar(pepper, targets)
+    for minion_id in targets:
+        if minion_id in invalidate_failures:
+            log.error('Remove:%s: Failed to clear cached pillar for %s.', itsm_id, minion_id)
+            failures.append(minion_id)
 
     # Run install packages job
     log.info('Remove:%s: Requesting package management job from the Salt master.', itsm_id)
-    for minion_id in minion_ids:
-        if minion_id in failures:
-            continue
-        try:
-            result = pepper.local_async(minion_id, 'state.apply', ('install_packages',))
-            if not result['return'][0]:
-                log.error('Remove:%s: Empty response when requesting package management job for %s.',
-                          itsm_id, minion_id, exc_info=True)
-                failures.append(minion_id)
-                continue
-            successes[minion_id] = result['return'][0]['jid']
-        except:
-            log.error('Remove:%s: Failed to request package management job for %s.',
-                      itsm_id, minion_id, exc_info=True)
-            failures.append(minion_id)
-            continue
+    targets = [minion_id for minion_id in minion_ids if minion_id not in failures]
+    if rollout:
+        successes, dispatch_failures, waves = run_rollout(pepper, 'remove', itsm_id, targets, 'state.apply',
+                                                          ('install_packages',), rollout, job_id)
+    else:
+        successes, dispatch_failures = dispatch_job(pepper, targets, 'state.apply', ('install_packages',),
+                                                    coalesce=True)
+        waves = {}
+    for minion_id in dispatch_failures:
+        log.error('Remove:%s: Failed to request package management job for %s.', itsm_id, minion_id)
+    failures.extend(dispatch_failures)
 
     # Send response if there are any failures
     if failures:
         log.info('Remove:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
-        return jsonify_clear({'success': False, 'successes': successes, 'failures': failures}), 500
+        return jsonify_clear({'success': False, 'successes': successes, 'failures': failures,
+                              'waves': waves}), 500
+
+    # The event listener completes the issue once all minions returned, rollouts wait for their waves themselves
+    if not rollout and track_job_returns('remove', itsm_id, successes):
+        log.info('Remove:%s: Finished with %s successes and %s failures, waiting for job returns.',
+                 itsm_id, len(successes), len(failures))
+        return jsonify_clear({'success': True, 'successes': successes, 'failures': failures,
+                              'waves': waves}), 200
 
     # Transition issue status to completed on Jira
+    update_job_stage(job_id, 'jira_complete')
     log.info('Remove:%s: Transitioning Jira issue status to completed.', itsm_id)
     try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
+        jira = get_jira()
         jira.transition_issue(itsm_id, 'Complete')
     except:
         log.error('Remove:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+        return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
 
     # Send success response
     log.info('Remove:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
-    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures})
+    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures,
+                          'waves': waves}), 200
 
 
 @app.route('/revert', methods=['POST'])
@@ -352,90 +896,122 @@ def revert():
     if body is None:
         return jsonify({'success': False, 'error': 'Expected a valid JSON request body.'}), 400
 
+    params, error = parse_revert(body)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    return run_operation('revert', params, body)
+
+
+def parse_revert(body):
     try:
         # Get request values
         itsm_id = body.get('itsm_id')
 
         # Validate request values
-        if not itsm_id:
-            return jsonify({'success': False, 'error': 'Expected ITSM ID in field \'itsm_id\'.'}), 400
+        if not itsm_id or not isinstance(itsm_id, str):
+            return None, 'Expected ITSM ID in field \'itsm_id\'.'
+        try:
+            rollout = parse_rollout(body.get('rollout'))
+        except ValueError:
+            return None, 'Expected batch size, maximum in-flight count and failure threshold in field \'rollout\'.'
     except:
-        return jsonify({'success': False, 'error': 'Invalid parameters.'}), 400
+        return None, 'Invalid parameters.'
 
+    params = {'itsm_id': itsm_id, 'rollout': rollout}
+    return params, None
+
+
+def run_revert(itsm_id, rollout=None, job_id=None):
     log.info('Revert:%s: Received request to revert issue %s.', itsm_id, itsm_id)
 
-    # Transition issue status to waiting on Jira
+    # Transition issue status to waiting on Jira while the request is updated in the database, the revert is
+    # committed right away so its effective package locks are not held while Jira responds
+    update_job_stage(job_id, 'jira_wait')
     log.info('Revert:%s: Transitioning Jira issue status to waiting.', itsm_id)
-    try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
-        jira.transition_issue(itsm_id, 'Wait')
-    except:
-        log.error('Revert:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+    waiting = JIRA_EXECUTOR.submit(transition_issue, 'Revert', itsm_id, 'Wait')
 
     # Update data in the database
+    update_job_stage(job_id, 'database')
     log.info('Revert:%s: Inserting package management request into the database.', itsm_id)
     try:
-        with psycopg2.connect(**POSTGRES_AUTH) as connection:
+        with POSTGRES_POOL.connection() as connection:
             try:
                 with connection.cursor() as cursor:
-                    cursor.execute(UPDATE_INSTALL_PACKAGES_QUERY, (itsm_id,))
-                connection.commit()
-                with connection.cursor() as cursor:
-                    cursor.execute(SELECT_INSTALL_PACKAGES_QUERY, (itsm_id,))
+                    cursor.execute(POSTGRES_POOL.statement('update_install_packages'), (itsm_id,))
+                    reverted = cursor.fetchall()
+                    cursor.execute(POSTGRES_POOL.statement('select_install_packages'), (itsm_id,))
                     minion_ids = list(set([row[0] for row in cursor]))
+                connection.commit()
             except:
                 log.error('Revert:%s: Failed to insert package management request into the database.',
                           itsm_id, exc_info=True)
-                return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+                return {'success': False, 'error': 'Failed to communicate with the database.'}, 500
     except:
         log.error('Revert:%s: Failed to communicate with the database.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+        return {'success': False, 'error': 'Failed to communicate with the database.'}, 500
+    # The reverted requests are restored again when the issue cannot be transitioned
+    if not waiting.result():
+        if reverted:
+            values = (*[list(column) for column in zip(*reverted)], itsm_id)
+            compensate_install_packages('Revert', itsm_id, 'restore_install_packages', values)
+        return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
 
     # Connect to the Salt master using Pepper
+    update_job_stage(job_id, 'salt')
     log.info('Revert:%s: Connecting to the Salt master.', itsm_id)
     try:
-        pepper = Pepper(SALT_URL)
-        pepper.login(SALT_USERNAME, SALT_PASSWORD, SALT_EAUTH)
+        pepper = SALT_SESSION.connect()
     except:
         log.error('Revert:%s: Failed to connect to the Salt master.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to connect to the Salt master.'}), 500
+        return {'success': False, 'error': 'Failed to connect to the Salt master.'}, 500
+
+    # Clear the cached pillar of the minions whose package requests changed
+    log.info('Revert:%s: Clearing cached pillar on the Salt master.', itsm_id)
+    failures = invalidate_pillar(pepper, minion_ids)
+    for minion_id in failures:
+        log.error('Revert:%s: Failed to clear cached pillar for %s.', itsm_id, minion_id)
 
     # Run install packages job
     log.info('Revert:%s: Requesting package management job from the Salt master.', itsm_id)
-    successes, failures = {}, []
-    for minion_id in minion_ids:
-        try:
-            result = pepper.local_async(minion_id, 'state.apply', ('install_packages',))
-            if not result['return'][0]:
-                log.error('Revert:%s: Empty response when requesting package management job for %s.',
-                          itsm_id, minion_id, exc_info=True)
-                failures.append(minion_id)
-                continue
-            successes[minion_id] = result['return'][0]['jid']
-        except:
-            log.error('Revert:%s: Failed to request package management job for %s.',
-                      itsm_id, minion_id, exc_info=True)
-            failures.append(minion_id)
-            continue
+    targets = [minion_id for minion_id in minion_ids if minion_id not in failures]
+    if rollout:
+        successes, dispatch_failures, waves = run_rollout(pepper, 'revert', itsm_id, targets, 'state.apply',
+                                                          ('install_packages',), rollout, job_id)
+    else:
+        successes, dispatch_failures = dispatch_job(pepper, targets, 'state.apply', ('install_packages',),
+                                                    coalesce=True)
+        waves = {}
+    for minion_id in dispatch_failures:
+        log.error('Revert:%s: Failed to request package management job for %s.', itsm_id, minion_id)
+    failures.extend(dispatch_failures)
 
     # Send response if there are any failures
     if failures:
         log.info('Revert:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
-        return jsonify_clear({'success': False, 'successes': successes, 'failures': failures}), 500
+        return jsonify_clear({'success': False, 'successes': successes, 'failures': failures,
+                              'waves': waves}), 500
+
+    # The event listener completes the issue once all minions returned, rollouts wait for their waves themselves
+    if not rollout and track_job_returns('revert', itsm_id, successes):
+        log.info('Revert:%s: Finished with %s successes and %s failures, waiting for job returns.',
+                 itsm_id, len(successes), len(failures))
+        return jsonify_clear({'success': True, 'successes': successes, 'failures': failures,
+                              'waves': waves}), 200
 
     # Transition issue status to completed on Jira
+    update_job_stage(job_id, 'jira_complete')
     log.info('Revert:%s: Transitioning Jira issue status to completed.', itsm_id)
     try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
+        jira = get_jira()
         jira.transition_issue(itsm_id, 'Complete')
     except:
         log.error('Revert:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+        return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
 
     # Send success response
     log.info('Revert:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
-    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures})
+    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures,
+                          'waves': waves}), 200
 
 
 @app.route('/reboot', methods=['POST'])
@@ -445,6 +1021,13 @@ def reboot():
     if body is None:
         return jsonify({'success': False, 'error': 'Expected a valid JSON request body.'}), 400
 
+    params, error = parse_reboot(body)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    return run_operation('reboot', params, body)
+
+
+def parse_reboot(body):
     try:
         # Get request values
         itsm_id = body.get('itsm_id')
@@ -452,280 +1035,1221 @@ def reboot():
         minion_ids = list(set([minion_ids] if isinstance(minion_ids, str) else minion_ids))
 
         # Validate request values
-        if not itsm_id:
-            return jsonify({'success': False, 'error': 'Expected ITSM ID in field \'itsm_id\'.'}), 400
+        if not itsm_id or not isinstance(itsm_id, str):
+            return None, 'Expected ITSM ID in field \'itsm_id\'.'
         if not minion_ids:
-            return jsonify({'success': False, 'error': 'Expected list of minion IDs in field \'minion_ids\'.'}), 400
+            return None, 'Expected list of minion IDs in field \'minion_ids\'.'
     except:
-        return jsonify({'success': False, 'error': 'Invalid parameters.'}), 400
+        return None, 'Invalid parameters.'
 
+    params = {'itsm_id': itsm_id, 'minion_ids': minion_ids}
+    return params, None
+
+
+def run_reboot(itsm_id, minion_ids, job_id=None):
     log.info('Reboot:%s: Received request to reboot %s minions.', itsm_id, len(minion_ids))
 
     # Transition issue status to waiting on Jira
+    update_job_stage(job_id, 'jira_wait')
     log.info('Reboot:%s: Transitioning Jira issue status to waiting.', itsm_id)
     try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
+        jira = get_jira()
         jira.transition_issue(itsm_id, 'Wait')
     except:
         log.error('Reboot:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+        return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
 
     # Connect to the Salt master using Pepper
+    update_job_stage(job_id, 'salt')
     log.info('Reboot:%s: Connecting to the Salt master.', itsm_id)
     try:
-        pepper = Pepper(SALT_URL)
-        pepper.login(SALT_USERNAME, SALT_PASSWORD, SALT_EAUTH)
+        pepper = SALT_SESSION.connect()
     except:
         log.error('Reboot:%s: Failed to connect to the Salt master.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to connect to the Salt master.'}), 500
+        return {'success': False, 'error': 'Failed to connect to the Salt master.'}, 500
 
     # Run reboot job
     log.info('Reboot:%s: Requesting reboot job from the Salt master.', itsm_id)
-    successes, failures = {}, []
-    job_ids = {}
-    for minion_id in minion_ids:
-        try:
-            result = pepper.local_async(minion_id, 'system.reboot', (0,))
-            job_ids[minion_id] = result['return'][0]['jid']
-        except:
-            log.error('Reboot:%s: Failed to request reboot job for %s.', itsm_id, minion_id, exc_info=True)
-            failures.append(minion_id)
+    successes = {}
+    job_ids, failures = dispatch_job(pepper, minion_ids, 'system.reboot', (0,))
+    for minion_id in failures:
+        log.error('Reboot:%s: Failed to request reboot job for %s.', itsm_id, minion_id)
 
     # Insert request data in the database
+    update_job_stage(job_id, 'database')
     log.info('Reboot:%s: Inserting reboot request into the database.', itsm_id)
     try:
-        with psycopg2.connect(**POSTGRES_AUTH) as connection:
-            for minion_id, job_id in job_ids.items():
+        with POSTGRES_POOL.connection() as connection:
+            for minion_id, jid in job_ids.items():
                 try:
                     with connection.cursor() as cursor:
-                        cursor.execute(INSERT_REBOOT_REQUESTS_QUERY, (itsm_id, minion_id, job_id))
-                    successes[minion_id] = job_id
+                        values = (itsm_id, minion_id, jid)
+                        cursor.execute(POSTGRES_POOL.statement('insert_reboot_requests'), values)
+                    successes[minion_id] = jid
                 except:
                     log.error('Reboot:%s: Failed to insert reboot request for %s into the database.',
                               itsm_id, minion_id, exc_info=True)
                     failures.append(minion_id)
     except:
         log.error('Reboot:%s: Failed to communicate with the database.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+        return {'success': False, 'error': 'Failed to communicate with the database.'}, 500
 
     # Send response if there are any failures
     if failures:
         log.info('Reboot:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
         return jsonify_clear({'success': False, 'successes': successes, 'failures': failures}), 500
 
+    # The event listener completes the issue once all minions returned
+    if track_job_returns('reboot', itsm_id, successes):
+        log.info('Reboot:%s: Finished with %s successes and %s failures, waiting for job returns.',
+                 itsm_id, len(successes), len(failures))
+        return jsonify_clear({'success': True, 'successes': successes, 'failures': failures}), 200
+
     # Transition issue status to completed on Jira
+    update_job_stage(job_id, 'jira_complete')
     log.info('Reboot:%s: Transitioning Jira issue status to completed.', itsm_id)
     try:
-        jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
+        jira = get_jira()
         jira.transition_issue(itsm_id, 'Complete')
     except:
         log.error('Reboot:%s: Failed to transition issue status on Jira.', itsm_id, exc_info=True)
-        return jsonify({'success': False, 'error': 'Failed to transition issue status on Jira.'}), 500
+        return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
 
     # Send success response
     log.info('Reboot:%s: Finished with %s successes and %s failures.', itsm_id, len(successes), len(failures))
-    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures})
+    return jsonify_clear({'success': True, 'successes': successes, 'failures': failures}), 200
+
+
+@app.route('/bulk', methods=['POST'])
+def bulk():
+    # Get request body, either a JSON array or one JSON object per line
+    try:
+        data = request.get_data(as_text=True)
+        if data.lstrip().startswith('['):
+            operations = json.loads(data)
+        else:
+            operations = [json.loads(line) for line in data.splitlines() if line.strip()]
+    except:
+        return jsonify({'success': False, 'error': 'Expected a JSON array or newline-delimited JSON objects.'}), 400
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'error': 'Expected a list of operations.'}), 400
+    if len(operations) > BULK_MAX_OPERATIONS:
+        return jsonify({'success': False, 'error': f'Expected at most {BULK_MAX_OPERATIONS} operations.'}), 400
+
+    # Validate all operations before running any of them
+    parsed, errors, itsm_ids = [], [], set()
+    for index, body in enumerate(operations):
+        operation = body.get('operation') if isinstance(body, dict) else None
+        if operation not in PARSERS:
+            error = 'Expected install, remove, revert or reboot in field \'operation\'.'
+            errors.append({'index': index, 'error': error})
+            continue
+        params, error = PARSERS[operation](body)
+        if not error and params.get('rollout'):
+            error = 'Rollouts are not supported in bulk operations.'
+        if not error and params['itsm_id'] in itsm_ids:
+            error = 'Expected each ITSM ID only once.'
+        if error:
+            errors.append({'index': index, 'error': error})
+            continue
+        params.pop('rollout', None)
+        itsm_ids.add(params['itsm_id'])
+        parsed.append((operation, params))
+    if errors:
+        return jsonify({'success': False, 'errors': errors}), 400
+
+    response, status = run_bulk(parsed)
+    return jsonify(response), status
+
+
+def run_bulk(operations):
+    log.info('Bulk: Received request to run %s operations.', len(operations))
+    results = [{'operation': operation, 'itsm_id': params['itsm_id'], 'success': True}
+               for operation, params in operations]
+    minion_ids = {index: params.get('minion_ids', []) for index, (_, params) in enumerate(operations)}
+    successes = {index: {} for index in range(len(operations))}
+    failures = {index: [] for index in range(len(operations))}
+
+    def pending(*names):
+        return [index for index, (operation, _) in enumerate(operations)
+                if operation in names and 'error' not in results[index]]
+
+    def fail(indexes, error):
+        for index in indexes:
+            results[index].update(success=False, error=error)
+
+    # Transition issue statuses to waiting on Jira
+    log.info('Bulk: Transitioning %s Jira issue statuses to waiting.', len(operations))
+    transitioned = transition_issues([params['itsm_id'] for _, params in operations], 'Wait')
+    fail([index for index, success in enumerate(transitioned) if not success],
+         'Failed to transition issue status on Jira.')
+
+    # Insert data of all operations into the database in a single transaction
+    log.info('Bulk: Inserting package management requests into the database.')
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            rows = [(operations[index][1]['itsm_id'], minion_id, operations[index][1]['package_name'],
+                     operations[index][1].get('package_version'), operations[index][1]['after'])
+                    for index in pending('install', 'remove') for minion_id in minion_ids[index]]
+            inserted = insert_install_packages(connection, rows)
+            with connection.cursor() as cursor:
+                for index in pending('revert'):
+                    cursor.execute(POSTGRES_POOL.statement('update_install_packages'), (results[index]['itsm_id'],))
+                    cursor.execute(POSTGRES_POOL.statement('select_install_packages'), (results[index]['itsm_id'],))
+                    minion_ids[index] = list(set([row[0] for row in cursor]))
+        promote_effective_packages()
+        for index in pending('install', 'remove'):
+            failures[index] = [minion_id for minion_id in minion_ids[index]
+                               if (results[index]['itsm_id'], minion_id) not in inserted]
+    except:
+        log.error('Bulk: Failed to communicate with the database.', exc_info=True)
+        fail(pending('install', 'remove', 'revert'), 'Failed to communicate with the database.')
+
+    # Requests that are not due yet are applied by the scheduler once they become effective
+    scheduled = [index for index in pending('install', 'remove') if not is_due(operations[index][1]['after'])]
+    for index in scheduled:
+        results[index]['scheduled'] = [minion_id for minion_id in minion_ids[index] if minion_id not in failures[index]]
+    applies = [index for index in pending('install', 'remove', 'revert') if index not in scheduled]
+    reboots = pending('reboot')
+
+    # Dispatch a single job for the union of all minions
+    if applies or reboots:
+        log.info('Bulk: Connecting to the Salt master.')
+        try:
+            pepper = SALT_SESSION.connect()
+        except:
+            log.error('Bulk: Failed to connect to the Salt master.', exc_info=True)
+            fail(applies + reboots, 'Failed to connect to the Salt master.')
+            applies, reboots = [], []
+
+    targets = sorted(set(minion_id for index in applies for minion_id in minion_ids[index]
+                         if minion_id not in failures[index]))
+    if targets:
+        log.info('Bulk: Requesting package management job for %s minions from the Salt master.', len(targets))
+        invalidate_failures = set(invalidate_pillar(pepper, targets))
+        targets = [minion_id for minion_id in targets if minion_id not in invalidate_failures]
+        job_ids, _ = dispatch_job(pepper, targets, 'state.apply', ('install_packages',), coalesce=True)
+        for index in applies:
+            for minion_id in minion_ids[index]:
+                if minion_id in job_ids:
+                    successes[index][minion_id] = job_ids[minion_id]
+                elif minion_id not in failures[index]:
+                    failures[index].append(minion_id)
+
+    targets = sorted(set(minion_id for index in reboots for minion_id in minion_ids[index]))
+    if targets:
+        log.info('Bulk: Requesting reboot job for %s minions from the Salt master.', len(targets))
+        job_ids, _ = dispatch_job(pepper, targets, 'system.reboot', (0,))
+        try:
+            with POSTGRES_POOL.connection() as connection:
+                with connection.cursor() as cursor:
+                    for index in reboots:
+                        for minion_id in minion_ids[index]:
+                            if minion_id not in job_ids:
+                                failures[index].append(minion_id)
+                                continue
+                            values = (results[index]['itsm_id'], minion_id, job_ids[minion_id])
+                            cursor.execute(POSTGRES_POOL.statement('insert_reboot_requests'), values)
+                            successes[index][minion_id] = job_ids[minion_id]
+        except:
+            log.error('Bulk: Failed to communicate with the database.', exc_info=True)
+            fail(reboots, 'Failed to communicate with the database.')
+
+    # The event listener completes the issues once all minions returned, the others are completed right away
+    completed = []
+    for index in pending('install', 'remove', 'revert', 'reboot'):
+        results[index]['successes'] = successes[index]
+        results[index]['failures'] = failures[index]
+        if failures[index]:
+            results[index]['success'] = False
+        elif index in scheduled or not track_job_returns(operations[index][0], results[index]['itsm_id'],
+                                                         successes[index]):
+            completed.append(index)
+    log.info('Bulk: Transitioning %s Jira issue statuses to completed.', len(completed))
+    transitioned = transition_issues([results[index]['itsm_id'] for index in completed], 'Complete')
+    fail([index for index, success in zip(completed, transitioned) if not success],
+         'Failed to transition issue status on Jira.')
+
+    # Send response
+    results = [jsonify_clear(result) for result in results]
+    succeeded = sum(result['success'] for result in results)
+    log.info('Bulk: Finished with %s successful and %s failed operations.', succeeded, len(results) - succeeded)
+    return {'success': succeeded == len(results), 'results': results}, 200 if succeeded == len(results) else 500
+
+
+def transition_issues(itsm_ids, transition):
+    # Transitions of different issues are independent, returns whether each transition succeeded
+    futures = [JIRA_EXECUTOR.submit(transition_issue, 'Bulk', itsm_id, transition) for itsm_id in itsm_ids]
+    return [future.result() for future in futures]
+
+
+def transition_issue(operation, itsm_id, transition):
+    try:
+        jira = get_jira()
+        jira.transition_issue(itsm_id, transition)
+    except:
+        log.error('%s:%s: Failed to transition issue status on Jira.', operation, itsm_id, exc_info=True)
+        return False
+    return True
+
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def job(job_id):
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('select_jobs'), (job_id,))
+                row = cursor.fetchone()
+    except:
+        log.error('Jobs:%s: Failed to communicate with the database.', job_id, exc_info=True)
+        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+
+    if row is None:
+        return jsonify({'success': False, 'error': 'Job not found.'}), 404
+
+    keys = ('id', 'operation', 'itsm_id', 'status', 'stage', 'result', 'status_code', 'attempts',
+            'created_at', 'started_at', 'finished_at')
+    data = dict(zip(keys, row))
+    for key in ('created_at', 'started_at', 'finished_at'):
+        data[key] = data[key].isoformat() if data[key] else None
+    return jsonify({'success': True, 'job': data})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    metrics = {'postgres_pool': POSTGRES_POOL.stats()}
+    if JIRA_CLIENT is not None:
+        metrics['jira_requests'] = JIRA_CLIENT.request_stats()
+    return jsonify(metrics)
 
 
 @app.route('/sync', methods=['POST'])
 def sync():
-    thread = threading.Thread(target=sync_data, daemon=True)
+    body = request.get_json(force=True, silent=True) or {}
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('request_sync_status'), (bool(body.get('force')),))
+    except:
+        log.error('Sync: Failed to communicate with the database.', exc_info=True)
+        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+
+    thread = threading.Thread(target=run_sync, daemon=True)
     thread.start()
     return jsonify({'success': True})
 
 
-def sync_data():
-    with SYNC_LOCK:
-        log.info('Sync: Received request to sync data with Jira.')
+@app.route('/sync', methods=['GET'])
+def sync_status():
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('select_sync_status'), (SYNC_LOCK_ID,))
+                row = cursor.fetchone()
+    except:
+        log.error('Sync: Failed to communicate with the database.', exc_info=True)
+        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
 
+    if row is None:
+        return jsonify({'success': True, 'sync': {'running': False, 'pending': False}})
+    pending, started_at, finished_at, last_success_at, last_duration, last_result, running = row
+    return jsonify({'success': True, 'sync': {
+        'running': running,
+        'pending': pending,
+        'started_at': started_at.isoformat() if started_at else None,
+        'finished_at': finished_at.isoformat() if finished_at else None,
+        'last_success_at': last_success_at.isoformat() if last_success_at else None,
+        'last_duration': last_duration,
+        'last_result': last_result,
+    }})
+
+
+def run_sync():
+    # Requests that arrive while a sync is running only mark the status as dirty,
+    # the process holding the lock runs at most one follow-up sync for all of them
+    while True:
         try:
-            pepper = Pepper(SALT_URL)
-            pepper.login(SALT_USERNAME, SALT_PASSWORD, SALT_EAUTH)
+            with POSTGRES_POOL.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_try_advisory_lock(%s)', (SYNC_LOCK_ID,))
+                    acquired = cursor.fetchone()[0]
+                connection.commit()
+                if not acquired:
+                    log.info('Sync: Another sync is running, coalescing request.')
+                    return
+                try:
+                    while True:
+                        with connection.cursor() as cursor:
+                            cursor.execute(POSTGRES_POOL.statement('claim_sync_status'))
+                            row = cursor.fetchone()
+                        connection.commit()
+                        if row is None:
+                            break
+                        start = time.monotonic()
+                        result = sync_data(force=row[0])
+                        with connection.cursor() as cursor:
+                            values = (time.monotonic() - start, result, result)
+                            cursor.execute(POSTGRES_POOL.statement('update_sync_status'), values)
+                        connection.commit()
+                finally:
+                    connection.rollback()
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT pg_advisory_unlock(%s)', (SYNC_LOCK_ID,))
+                    connection.commit()
+
+                # A request may have arrived after the last claim but before the lock was released
+                with connection.cursor() as cursor:
+                    cursor.execute(POSTGRES_POOL.statement('select_sync_status'), (SYNC_LOCK_ID,))
+                    row = cursor.fetchone()
+                if row is None or not row[0]:
+                    return
         except:
-            log.error('Sync: Failed to connect to the Salt master.', exc_info=True)
-            return False
+            log.error('Sync: Failed to coordinate sync with the database.', exc_info=True)
+            return
 
-        log.info('Sync: Requesting list of minions and packages from the Salt master.')
-        linux_return_data, windows_return_data = [], []
+
+def sync_data(force=False):
+    log.info('Sync: Received request to sync data with Jira.')
+
+    # Fingerprints of the last successful run of each stage, unchanged stages are skipped
+    fingerprints = {}
+    if not force:
         try:
-            kwarg = {'all_versions': True}
-            linux_result = pepper.local('kernel:Linux', 'pkg.list_repo_pkgs', tgt_type='grain')
-            linux_return_data.extend(linux_result['return'])
-            pepper.local('kernel:Windows', 'state.apply', ('install_chocolatey',), tgt_type='grain')
-            windows_result = pepper.local('kernel:Windows', 'chocolatey.list', kwarg=kwarg, tgt_type='grain')
-            windows_return_data.extend(windows_result['return'])
+            with POSTGRES_POOL.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(POSTGRES_POOL.statement('select_sync_fingerprints'))
+                    fingerprints = dict(cursor.fetchall())
         except:
-            log.error('Sync: Failed to fetch available packages from the Salt master.', exc_info=True)
-            return False
-
-        log.info('Sync: Preparing data to be inserted.')
-        minion_ids = set()
-        available_packages = []
-        for data in linux_return_data:
-            for minion_id, packages in data.items():
-                if not isinstance(packages, dict):
-                    continue
-                minion_ids.add((minion_id, 'Linux'))
-                for package, versions in packages.items():
-                    blacklisted = (
-                        package.startswith('linux-') or
-                        package.endswith('-dev') or
-                        package.endswith('-dbg') or
-                        package.endswith('-doc')
-                    )
-                    if blacklisted:
-                        continue
-                    for version in versions:
-                        if version != '(null)':
-                            available_packages.append(('Linux', package, version))
-        for data in windows_return_data:
-            for minion_id, packages in data.items():
-                if not isinstance(packages, dict):
-                    continue
-                minion_ids.add((minion_id, 'Windows'))
-                for package, versions in packages.items():
-                    for version in versions:
-                        if version != '(null)':
-                            available_packages.append(('Windows', package, version))
-        available_packages += [('Windows', package, version) for package, version in CHOCOLATEY_PACKAGES]
-        minion_ids = [(minion_id, operating_system) for minion_id, operating_system in minion_ids]
-
-        log.info('Sync: Inserting new data into the database.')
+            log.warning('Sync: Failed to read stage fingerprints from the database.', exc_info=True)
+
+    try:
+        pepper = SALT_SESSION.connect()
+    except:
+        log.error('Sync: Failed to connect to the Salt master.', exc_info=True)
+        return False
+
+    # Minions with the same release, architecture and package sources share one catalog
+    pipelines = [
+        ('Linux', 'pkg.list_repo_pkgs', None, None, ('pkg.list_repos',), []),
+        ('Windows', 'chocolatey.list', {'all_versions': True}, ('state.apply', ('install_chocolatey',)),
+         ('cmd.run', ('choco source list -r',)), CHOCOLATEY_PACKAGES),
+    ]
+
+    # Each operating system is collected concurrently, a failing or hanging pipeline does not abort the others
+    failures = []
+    executor = concurrent.futures.ThreadPoolExecutor(len(pipelines), thread_name_prefix='Sync')
+    futures = {}
+    for pipeline in pipelines:
+        futures[executor.submit(sync_operating_system, pepper, *pipeline)] = pipeline[0]
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=SYNC_PIPELINE_TIMEOUT):
+            try:
+                future.result()
+            except:
+                log.error('Sync: Failed to fetch available %s packages from the Salt master.', futures[future],
+                          exc_info=True)
+                failures.append(futures[future])
+    except concurrent.futures.TimeoutError:
+        for future, operating_system in futures.items():
+            if not future.done():
+                log.error('Sync: Fetching available %s packages took longer than %ss.', operating_system,
+                          SYNC_PIPELINE_TIMEOUT)
+                failures.append(operating_system)
+    # Pipelines that missed the timeout end with their bounded Salt requests, the sync does not wait for them
+    executor.shutdown(wait=False)
+
+    log.info('Sync: Reading all data from the database.')
+    linux_minions, windows_minions = [], []
+    linux_packages, windows_packages = {}, {}
+    linux_packages_total = windows_packages_total = 0
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('select_minions'), ('Linux',))
+                linux_minions = [row[0] for row in cursor]
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('select_minions'), ('Windows',))
+                windows_minions = [row[0] for row in cursor]
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('select_available_packages'), ('Linux',))
+                for package_name, package_version in cursor:
+                    to_add = 1 if package_name in linux_packages else 3
+                    if linux_packages_total + to_add >= JIRA.FIELD_OPTIONS_LIMIT:
+                        break
+                    linux_packages_total += to_add
+                    linux_packages.setdefault(package_name, []).append(package_version)
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('select_available_packages'), ('Windows',))
+                for package_name, package_version in cursor:
+                    to_add = 1 if package_name in windows_packages else 3
+                    if windows_packages_total + to_add >= JIRA.FIELD_OPTIONS_LIMIT:
+                        break
+                    windows_packages_total += to_add
+                    windows_packages.setdefault(package_name, []).append(package_version)
+    except:
+        log.error('Sync: Failed to communicate with the database.', exc_info=True)
+        return False
+
+    log.info('Sync: Preparing data to be sent to Jira.')
+    all_minions = sorted(linux_minions + windows_minions)
+    linux_minions = sorted(linux_minions)
+    windows_minions = sorted(windows_minions)
+    for package_name, package_versions in linux_packages.items():
+        tail = sort_versions(package_versions, 'dpkg', reverse=True)
+        linux_packages[package_name] = ['Remove'] + [version for version in tail if version.lower() != 'remove']
+    for package_name, package_versions in windows_packages.items():
+        tail = sort_versions(package_versions, 'nuget', reverse=True)
+        windows_packages[package_name] = ['Remove'] + [version for version in tail if version.lower() != 'remove']
+    linux_packages = dict(sorted(linux_packages.items(), key=lambda item: item[0]))
+    windows_packages = dict(sorted(windows_packages.items(), key=lambda item: item[0]))
+
+    try:
+        log.info('Sync: Getting custom fields from Jira.')
+        jira = get_jira()
+        fields = {field['name']: field for field in jira.fields()}
+
+        # Populate minions
+        all_minions_field = fields.get(JIRA_ALL_MINIONS_FIELD)
+        if all_minions_field is None:
+            all_minions_field = jira.create_custom_field(
+                name=JIRA_ALL_MINIONS_FIELD,
+                description='The ID of the Salt minions.',
+                type=CustomFieldType.MULTI_SELECT,
+                searcherKey=CustomFieldSearcherKey.MULTI_SELECT,
+            )
+        sync_field_options(jira, all_minions_field['id'], JIRA_ALL_MINIONS_FIELD, all_minions, fingerprints)
+
+        # Populate Linux minions
+        linux_minions_field = fields.get(JIRA_LINUX_MINIONS_FIELD)
+        if linux_minions_field is None:
+            linux_minions_field = jira.create_custom_field(
+                name=JIRA_LINUX_MINIONS_FIELD,
+                description='The ID of the Salt minions.',
+                type=CustomFieldType.MULTI_SELECT,
+                searcherKey=CustomFieldSearcherKey.MULTI_SELECT,
+            )
+        sync_field_options(jira, linux_minions_field['id'], JIRA_LINUX_MINIONS_FIELD, linux_minions, fingerprints)
+
+        # Populate Windows minions
+        windows_minions_field = fields.get(JIRA_WINDOWS_MINIONS_FIELD)
+        if windows_minions_field is None:
+            windows_minions_field = jira.create_custom_field(
+                name=JIRA_WINDOWS_MINIONS_FIELD,
+                description='The ID of the Salt minions.',
+                type=CustomFieldType.MULTI_SELECT,
+                searcherKey=CustomFieldSearcherKey.MULTI_SELECT,
+            )
+        sync_field_options(jira, windows_minions_field['id'], JIRA_WINDOWS_MINIONS_FIELD, windows_minions,
+                           fingerprints)
+
+        # Populate Linux packages
+        linux_packages_field = fields.get(JIRA_LINUX_PACKAGE_FIELD)
+        if linux_packages_field is None:
+            linux_packages_field = jira.create_custom_field(
+                name=JIRA_LINUX_PACKAGE_FIELD,
+                description='The system package and version to install, upgrade or downgrade to, or remove.',
+                type=CustomFieldType.CASCADING_SELECT,
+                searcherKey=CustomFieldSearcherKey.CASCADING_SELECT,
+            )
+        sync_field_options(jira, linux_packages_field['id'], JIRA_LINUX_PACKAGE_FIELD, linux_packages, fingerprints)
+
+        # Populate Windows packages
+        windows_packages_field = fields.get(JIRA_WINDOWS_PACKAGE_FIELD)
+        if windows_packages_field is None:
+            windows_packages_field = jira.create_custom_field(
+                name=JIRA_WINDOWS_PACKAGE_FIELD,
+                description='The system package and version to install, upgrade or downgrade to, or remove.',
+                type=CustomFieldType.CASCADING_SELECT,
+                searcherKey=CustomFieldSearcherKey.CASCADING_SELECT,
+            )
+        sync_field_options(jira, windows_packages_field['id'], JIRA_WINDOWS_PACKAGE_FIELD, windows_packages,
+                           fingerprints)
+    except:
+        log.error('Sync: Failed to send data to Jira.', exc_info=True)
+        return False
+
+    if failures:
+        log.warning('Sync: Finished without fresh data for %s.', ', '.join(sorted(failures)))
+        return False
+    log.info('Sync: Finished.')
+    return True
+
+
+def sync_operating_system(pepper, operating_system, fun, kwarg, prepare, group_by, packages):
+    log.info('Sync: Requesting list of %s minions and packages from the Salt master.', operating_system)
+    deadline = time.monotonic() + SYNC_PIPELINE_TIMEOUT
+
+    # Every chunk is copied into staging tables and merged in one statement per table at the end,
+    # Salt requests of the pipeline give up instead of waiting for an unresponsive master
+    with pepper.request_timeout(SYNC_REQUEST_TIMEOUT), POSTGRES_POOL.connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_STAGING_TABLES_QUERY)
+            available_packages = [(operating_system, package, version) for package, version in packages]
+            copy_rows(cursor, COPY_STAGING_AVAILABLE_PACKAGES_QUERY, available_packages)
+
+            error = None
+            minion_data = collect_minion_data(pepper, operating_system, fun, kwarg=kwarg, prepare=prepare,
+                                              group_by=group_by)
+            try:
+                for members, return_data in minion_data:
+                    minion_ids, available_packages = parse_minion_data(operating_system, return_data)
+                    minion_ids.update((minion_id, operating_system) for minion_id in members)
+                    del return_data
+                    copy_rows(cursor, COPY_STAGING_MINIONS_QUERY, minion_ids)
+                    copy_rows(cursor, COPY_STAGING_AVAILABLE_PACKAGES_QUERY, available_packages)
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f'Collection of {operating_system} minions took longer than '
+                                           f'{SYNC_PIPELINE_TIMEOUT}s')
+            except psycopg2.Error:
+                raise
+            except Exception as exc:
+                error = exc
+            finally:
+                minion_data.close()
+
+            # Data collected before a Salt failure or timeout is still stored
+            log.info('Sync: Merging %s minions and packages into the database.', operating_system)
+            cursor.execute(MERGE_STAGING_MINIONS_QUERY)
+            cursor.execute(MERGE_STAGING_AVAILABLE_PACKAGES_QUERY)
+    if error is not None:
+        raise error
+
+
+def collect_minion_data(pepper, operating_system, fun, kwarg=None, prepare=None, group_by=None):
+    # Legacy mode, one blocking call targeting the whole fleet
+    if SYNC_COLLECTION_MODE == 'fleet':
+        tgt = f'kernel:{operating_system}'
+        if prepare:
+            pepper.local(tgt, *prepare, tgt_type='grain')
+        for return_data in pepper.local(tgt, fun, kwarg=kwarg, tgt_type='grain')['return']:
+            yield [], return_data
+        return
+
+    # Stream mode, bounded chunks of minions so only one chunk of return data is held at a time,
+    # the fleet is listed with only the grains used for grouping instead of the cached grains of every minion
+    result = pepper.local(f'kernel:{operating_system}', 'grains.item', arg=('kernel', 'osfinger', 'osarch'),
+                          tgt_type='grain', timeout=SYNC_TIMEOUT)
+    grains = {
+        minion_id: (minion_grains.get('osfinger'), minion_grains.get('osarch'))
+        for data in result['return'] if isinstance(data, dict)
+        for minion_id, minion_grains in data.items()
+        if isinstance(minion_grains, dict) and minion_grains.get('kernel') == operating_system
+    }
+    del result
+    minion_ids = sorted(grains)
+    if prepare:
+        for index in range(0, len(minion_ids), SYNC_CHUNK_SIZE):
+            chunk = minion_ids[index:index + SYNC_CHUNK_SIZE]
+            try:
+                pepper.local(chunk, *prepare, tgt_type='list', timeout=SYNC_TIMEOUT)
+            except:
+                log.error('Sync: Failed to prepare %s %s minions.', len(chunk), operating_system, exc_info=True)
+
+    if group_by and SYNC_GROUP_MINIONS:
+        groups = group_minions(pepper, operating_system, grains, group_by)
+    else:
+        groups = [[minion_id] for minion_id in minion_ids]
+    log.info('Sync: Collecting data from %s representatives of %s %s minions in chunks of %s.', len(groups),
+             len(minion_ids), operating_system, SYNC_CHUNK_SIZE)
+
+    # The catalog of a group is fetched from its first member, the next member is tried if it does not answer
+    for _ in range(SYNC_REPRESENTATIVE_ATTEMPTS):
+        failed = []
+        for index in range(0, len(groups), SYNC_CHUNK_SIZE):
+            chunk = groups[index:index + SYNC_CHUNK_SIZE]
+            return_data = {}
+            try:
+                result = pepper.local([group[0] for group in chunk], fun, kwarg=kwarg, tgt_type='list',
+                                      timeout=SYNC_TIMEOUT)
+                for data in result['return']:
+                    if isinstance(data, dict):
+                        return_data.update(data)
+                del result
+            except:
+                log.error('Sync: Failed to collect data from %s %s minions.', len(chunk), operating_system,
+                          exc_info=True)
+            for group in chunk:
+                packages = return_data.get(group[0])
+                if isinstance(packages, dict):
+                    yield group, {group[0]: packages}
+                elif len(group) > 1:
+                    failed.append(group[1:])
+            del return_data
+        if not failed:
+            break
+        log.warning('Sync: Retrying %s groups of %s minions with another representative.', len(failed),
+                    operating_system)
+        groups = failed
+
+
+def group_minions(pepper, operating_system, grains, group_by):
+    minion_ids = sorted(grains)
+    sources = {}
+    for index in range(0, len(minion_ids), SYNC_CHUNK_SIZE):
+        chunk = minion_ids[index:index + SYNC_CHUNK_SIZE]
         try:
-            with psycopg2.connect(**POSTGRES_AUTH) as connection:
-                with connection.cursor() as cursor:
-                    psycopg2.extras.execute_batch(cursor, INSERT_MINIONS_QUERY, minion_ids)
+            result = pepper.local(chunk, *group_by, tgt_type='list', timeout=SYNC_TIMEOUT)
+        except:
+            log.error('Sync: Failed to fingerprint %s %s minions.', len(chunk), operating_system, exc_info=True)
+            continue
+        for data in result['return']:
+            if isinstance(data, dict):
+                sources.update(data)
+
+    # Minions that could not be fingerprinted form their own group
+    groups = {}
+    for minion_id in minion_ids:
+        if minion_id in sources:
+            key = (*grains[minion_id], fingerprint(sources[minion_id]))
+        else:
+            key = (minion_id,)
+        groups.setdefault(key, []).append(minion_id)
+    return list(groups.values())
+
+
+def parse_minion_data(operating_system, return_data):
+    minion_ids = set()
+    available_packages = set()
+    for minion_id, packages in return_data.items():
+        if not isinstance(packages, dict):
+            continue
+        minion_ids.add((minion_id, operating_system))
+        for package, versions in packages.items():
+            blacklisted = operating_system == 'Linux' and (
+                package.startswith('linux-') or
+                package.endswith('-dev') or
+                package.endswith('-dbg') or
+                package.endswith('-doc')
+            )
+            if blacklisted:
+                continue
+            for version in versions:
+                if version != '(null)':
+                    available_packages.add((operating_system, package, version))
+    return minion_ids, available_packages
+
+
+def copy_rows(cursor, query, rows):
+    if not rows:
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(query, buffer)
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    return RE_COPY_ESCAPE.sub(lambda match: COPY_ESCAPES[match.group(0)], str(value))
+
+
+def run_operation(operation, params, body):
+    # Run the operation inline unless asynchronous mode was requested, rollouts always run as queued jobs
+    if not body.get('async', JOBS_ASYNC_MODE) and not params.get('rollout'):
+        response, status = OPERATIONS[operation](**params)
+        return jsonify(response), status
+
+    try:
+        payload = {key: value.isoformat() if isinstance(value, datetime.datetime) else value
+                   for key, value in params.items()}
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                values = (operation, params.get('itsm_id'), psycopg2.extras.Json(payload))
+                cursor.execute(POSTGRES_POOL.statement('insert_jobs'), values)
+                job_id = cursor.fetchone()[0]
+    except:
+        log.error('Jobs: Failed to queue %s job for %s.', operation, params.get('itsm_id'), exc_info=True)
+        return jsonify({'success': False, 'error': 'Failed to communicate with the database.'}), 500
+
+    JOBS_EVENT.set()
+    log.info('Jobs:%s: Queued %s job for %s.', job_id, operation, params.get('itsm_id'))
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+
+def job_worker():
+    while True:
+        job = None
+        try:
+            with POSTGRES_POOL.connection() as connection:
                 with connection.cursor() as cursor:
-                    psycopg2.extras.execute_batch(cursor, INSERT_AVAILABLE_PACKAGES_QUERY, available_packages)
+                    values = (JOBS_STALE_TIMEOUT, JOBS_MAX_ATTEMPTS)
+                    cursor.execute(POSTGRES_POOL.statement('update_stale_jobs'), values)
+                    cursor.execute(POSTGRES_POOL.statement('claim_jobs'), values)
+                    job = cursor.fetchone()
         except:
-            log.error('Failed to communicate with the database.', exc_info=True)
-            return False
+            log.error('Jobs: Failed to claim a job from the database.', exc_info=True)
+
+        if job is None:
+            JOBS_EVENT.wait(JOBS_POLL_INTERVAL)
+            JOBS_EVENT.clear()
+            continue
+        run_job(*job)
+
+
+def run_job(job_id, operation, payload):
+    log.info('Jobs:%s: Running %s job.', job_id, operation)
+    params = dict(payload)
+    if params.get('after'):
+        params['after'] = isoparse(params['after'])
+
+    # Running jobs are kept fresh so they are not claimed again as stale, however long a stage takes
+    finished = threading.Event()
+    heartbeat = threading.Thread(target=job_heartbeat, args=(job_id, finished), name=f'JobHeartbeat-{job_id}',
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        response, status = OPERATIONS[operation](**params, job_id=job_id)
+    except:
+        log.error('Jobs:%s: Unexpected error while running %s job.', job_id, operation, exc_info=True)
+        response, status = {'success': False, 'error': 'Unexpected error while running job.'}, 500
+    finally:
+        finished.set()
+        heartbeat.join()
+
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                values = ('succeeded' if status < 400 else 'failed', psycopg2.extras.Json(response), status, job_id)
+                cursor.execute(POSTGRES_POOL.statement('update_jobs_result'), values)
+    except:
+        log.error('Jobs:%s: Failed to store job result in the database.', job_id, exc_info=True)
+    log.info('Jobs:%s: Finished %s job with status %s.', job_id, operation, status)
 
-        log.info('Sync: Reading all data from the database.')
-        linux_minions, windows_minions = [], []
-        linux_packages, windows_packages = {}, {}
-        linux_packages_total = windows_packages_total = 0
+
+def job_heartbeat(job_id, finished):
+    interval = min(JOBS_HEARTBEAT_INTERVAL, JOBS_STALE_TIMEOUT / 3)
+    while not finished.wait(interval):
         try:
-            with psycopg2.connect(**POSTGRES_AUTH) as connection:
+            with POSTGRES_POOL.connection() as connection:
                 with connection.cursor() as cursor:
-                    cursor.execute(SELECT_MINIONS_QUERY, ('Linux',))
-                    linux_minions = [row[0] for row in cursor]
+                    cursor.execute(POSTGRES_POOL.statement('heartbeat_jobs'), (job_id,))
+        except:
+            log.warning('Jobs:%s: Failed to refresh running job.', job_id, exc_info=True)
+
+
+def update_job_stage(job_id, stage):
+    if job_id is None:
+        return
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('update_jobs_stage'), (stage, job_id))
+    except:
+        log.warning('Jobs:%s: Failed to update job stage to %s.', job_id, stage, exc_info=True)
+
+
+def start_job_workers():
+    for index in range(JOBS_WORKERS):
+        thread = threading.Thread(target=job_worker, name=f'JobWorker-{index}', daemon=True)
+        thread.start()
+
+
+def scheduler_worker():
+    while True:
+        time.sleep(SCHEDULER_INTERVAL)
+        promote_effective_packages()
+        run_scheduled()
+
+
+def start_scheduler_worker():
+    thread = threading.Thread(target=scheduler_worker, name='SchedulerWorker', daemon=True)
+    thread.start()
+
+
+def promote_effective_packages():
+    # Requests become effective for the pillar once their after time has passed, their minions are queued for a run
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('promote_effective_packages'))
+                minion_ids = [row[0] for row in cursor]
+    except:
+        log.error('Scheduler: Failed to promote due package requests.', exc_info=True)
+        return []
+    if minion_ids:
+        log.info('Scheduler: Promoted due package requests for %s minions.', len(minion_ids))
+    return minion_ids
+
+
+def run_scheduled():
+    # Minions queued since the last run are applied together, rows stay locked until the run was dispatched
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('claim_scheduled_runs'), (SCHEDULER_BATCH_SIZE,))
+                minion_ids = [row[0] for row in cursor]
+            if not minion_ids:
+                return
+
+            log.info('Scheduler: Requesting package management job for %s minions.', len(minion_ids))
+            try:
+                pepper = SALT_SESSION.connect()
+            except:
+                log.error('Scheduler: Failed to connect to the Salt master.', exc_info=True)
+                return
+            failures = invalidate_pillar(pepper, minion_ids)
+            targets = [minion_id for minion_id in minion_ids if minion_id not in failures]
+            successes, dispatch_failures = dispatch_job(pepper, targets, 'state.apply', ('install_packages',),
+                                                        coalesce=True)
+            failures.extend(dispatch_failures)
+            if failures:
+                log.error('Scheduler: Failed to request package management job for %s minions.', len(failures))
+
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('update_scheduled_runs'), (failures,))
+                values = (list(successes), SCHEDULER_MAX_ATTEMPTS)
+                cursor.execute(POSTGRES_POOL.statement('delete_scheduled_runs'), values)
+    except:
+        log.error('Scheduler: Failed to communicate with the database.', exc_info=True)
+
+
+def finish_scheduled(operation, itsm_id, minion_ids, failures, after, job_id):
+    scheduled = [minion_id for minion_id in minion_ids if minion_id not in failures]
+    log.info('%s:%s: Scheduled package management job for %s minions at %s.', operation, itsm_id, len(scheduled),
+             after.isoformat())
+
+    # Send response if there are any failures
+    if failures:
+        log.info('%s:%s: Finished with %s scheduled and %s failures.', operation, itsm_id, len(scheduled),
+                 len(failures))
+        return jsonify_clear({'success': False, 'scheduled': scheduled, 'failures': failures}), 500
+
+    # Transition issue status to completed on Jira
+    update_job_stage(job_id, 'jira_complete')
+    log.info('%s:%s: Transitioning Jira issue status to completed.', operation, itsm_id)
+    try:
+        jira = get_jira()
+        jira.transition_issue(itsm_id, 'Complete')
+    except:
+        log.error('%s:%s: Failed to transition issue status on Jira.', operation, itsm_id, exc_info=True)
+        return {'success': False, 'error': 'Failed to transition issue status on Jira.'}, 500
+
+    # Send success response
+    log.info('%s:%s: Finished with %s scheduled and %s failures.', operation, itsm_id, len(scheduled), len(failures))
+    return jsonify_clear({'success': True, 'scheduled': scheduled, 'failures': failures}), 200
+
+
+def track_job_returns(operation, itsm_id, successes):
+    if SALT_COMPLETION_MODE != 'events' or not successes:
+        return False
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                values = (itsm_id, operation, list(successes.values()), list(successes))
+                cursor.execute(POSTGRES_POOL.statement('insert_job_returns'), values)
+    except:
+        log.error('%s:%s: Failed to store job IDs in the database.', operation.capitalize(), itsm_id, exc_info=True)
+        return False
+    # Other processes track their job IDs once the event listener reloads them from the database
+    tracked = TRACKED_JOB_RETURNS
+    if tracked is not None:
+        tracked.update(('ret', jid) for jid in successes.values())
+        if operation == 'reboot':
+            tracked.update(('start', minion_id) for minion_id in successes)
+    return True
+
+
+def event_listener():
+    # Only one process in the cluster listens to the event stream at a time
+    while True:
+        try:
+            with POSTGRES_POOL.connection() as connection:
                 with connection.cursor() as cursor:
-                    cursor.execute(SELECT_MINIONS_QUERY, ('Windows',))
-                    windows_minions = [row[0] for row in cursor]
+                    cursor.execute('SELECT pg_try_advisory_lock(%s)', (SALT_EVENTS_LOCK_ID,))
+                    acquired = cursor.fetchone()[0]
+                connection.commit()
+                if acquired:
+                    log.info('Events: Listening to the Salt event stream.')
+                    try:
+                        process_events(connection)
+                    finally:
+                        connection.rollback()
+                        with connection.cursor() as cursor:
+                            cursor.execute('SELECT pg_advisory_unlock(%s)', (SALT_EVENTS_LOCK_ID,))
+                        connection.commit()
+        except:
+            log.error('Events: Failed to process the Salt event stream.', exc_info=True)
+        time.sleep(SALT_EVENTS_RETRY_INTERVAL)
+
+
+def start_event_listener():
+    if SALT_COMPLETION_MODE != 'events':
+        return
+    thread = threading.Thread(target=event_listener, name='EventListener', daemon=True)
+    thread.start()
+
+
+def read_events(events, stop):
+    # Only the events needed to track job returns are kept, the rest of the stream is dropped right away
+    while not stop.is_set():
+        try:
+            pepper = SALT_SESSION.connect()
+            for event in pepper.events(timeout=SALT_EVENTS_READ_TIMEOUT):
+                if stop.is_set():
+                    return
+                event = parse_event(event)
+                if event is not None:
+                    events.put(event)
+        except Exception as exc:
+            if 'Authentication denied' in str(exc):
+                SALT_SESSION.invalidate()
+            log.warning('Events: Lost connection to the Salt event stream.', exc_info=True)
+        stop.wait(SALT_EVENTS_RETRY_INTERVAL)
+
+
+def parse_event(event):
+    tag = event.get('tag') or ''
+    data = event.get('data') or {}
+    parts = tag.split('/')
+    if len(parts) == 5 and parts[0] == 'salt' and parts[1] == 'job' and parts[3] == 'ret':
+        succeeded = data.get('success', True) and data.get('retcode', 0) == 0
+        return 'ret', parts[2], parts[4], 'succeeded' if succeeded else 'failed'
+    if len(parts) == 4 and parts[0] == 'salt' and parts[1] == 'minion' and parts[3] == 'start':
+        return 'start', None, parts[2], 'succeeded'
+    return None
+
+
+def process_events(connection):
+    global TRACKED_JOB_RETURNS
+    events = queue.Queue(SALT_EVENTS_UNMATCHED_SIZE)
+    stop = threading.Event()
+    reader = threading.Thread(target=read_events, args=(events, stop), name='EventReader', daemon=True)
+    reader.start()
+
+    # Number of minions without a return per ITSM ID, loaded from the database when first seen
+    pending = {}
+    # Returns that arrived before their job IDs were stored, retried until they expire
+    unmatched = collections.OrderedDict()
+    next_sweep = time.monotonic() + SALT_EVENTS_SWEEP_INTERVAL
+    # Only events of tracked job IDs touch the database, the others wait in memory until they expire
+    TRACKED_JOB_RETURNS = load_tracked_job_returns(connection)
+    try:
+        while True:
+            try:
+                event = events.get(timeout=SALT_EVENTS_SWEEP_INTERVAL)
+            except queue.Empty:
+                event = None
+            if event is not None and not (is_tracked(event) and apply_event(connection, pending, event)):
+                unmatched[event] = time.monotonic()
+                while len(unmatched) > SALT_EVENTS_UNMATCHED_SIZE:
+                    unmatched.popitem(last=False)
+
+            if time.monotonic() < next_sweep:
+                continue
+            next_sweep = time.monotonic() + SALT_EVENTS_SWEEP_INTERVAL
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('update_stale_job_returns'), (SALT_EVENTS_TIMEOUT,))
+                itsm_ids = [row[0] for row in cursor]
+            connection.commit()
+            for itsm_id in itsm_ids:
+                count_job_return(connection, pending, itsm_id)
+            TRACKED_JOB_RETURNS = load_tracked_job_returns(connection)
+            expired = time.monotonic() - SALT_EVENTS_UNMATCHED_TTL
+            for event, received in list(unmatched.items()):
+                if received < expired or is_tracked(event) and apply_event(connection, pending, event):
+                    del unmatched[event]
+    finally:
+        TRACKED_JOB_RETURNS = None
+        stop.set()
+
+
+def load_tracked_job_returns(connection):
+    # Job IDs stored by any process, reboots are also matched by the start event of their minion
+    tracked = set()
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_POOL.statement('select_pending_job_returns'))
+        for jid, minion_id, operation in cursor:
+            tracked.add(('ret', jid))
+            if operation == 'reboot':
+                tracked.add(('start', minion_id))
+    connection.commit()
+    return tracked
+
+
+def is_tracked(event):
+    kind, jid, minion_id, _ = event
+    return (kind, jid if kind == 'ret' else minion_id) in TRACKED_JOB_RETURNS
+
+
+def apply_event(connection, pending, event):
+    kind, jid, minion_id, status = event
+    with connection.cursor() as cursor:
+        if kind == 'ret':
+            cursor.execute(POSTGRES_POOL.statement('update_job_returns'), (status, jid, minion_id, status))
+        else:
+            cursor.execute(POSTGRES_POOL.statement('update_reboot_job_returns'), (minion_id,))
+        itsm_ids = [row[0] for row in cursor]
+    connection.commit()
+    for itsm_id in itsm_ids:
+        count_job_return(connection, pending, itsm_id)
+    return bool(itsm_ids)
+
+
+def count_job_return(connection, pending, itsm_id):
+    if itsm_id in pending:
+        pending[itsm_id] -= 1
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_POOL.statement('select_job_returns'), (itsm_id,))
+            pending[itsm_id] = cursor.fetchone()[0]
+        connection.commit()
+    if pending[itsm_id] > 0:
+        return
+    del pending[itsm_id]
+
+    # Job returns of an ITSM ID are finalized once, when none of its minions is pending anymore
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_POOL.statement('finalize_job_returns'), (itsm_id, itsm_id))
+        rows = cursor.fetchall()
+    connection.commit()
+    if not rows:
+        return
+    failures = {}
+    for operation, minion_id, status in rows:
+        if status != 'succeeded':
+            failures.setdefault(status, []).append(minion_id)
+    try:
+        jira = get_jira()
+        if not failures:
+            log.info('Events:%s: All %s minions returned successfully, transitioning Jira issue status to completed.',
+                     itsm_id, len(rows))
+            jira.transition_issue(itsm_id, 'Complete')
+        else:
+            log.info('Events:%s: %s of %s minions did not return successfully, commenting on Jira issue.',
+                     itsm_id, sum(len(minion_ids) for minion_ids in failures.values()), len(rows))
+            lines = [f'{status.capitalize()}: {", ".join(sorted(minion_ids))}'
+                     for status, minion_ids in sorted(failures.items())]
+            jira.add_comment(itsm_id, 'Salt jobs did not complete successfully on all minions.\n' + '\n'.join(lines))
+    except:
+        log.error('Events:%s: Failed to report job returns on Jira.', itsm_id, exc_info=True)
+
+
+def get_jira():
+    global JIRA_CLIENT
+    with JIRA_LOCK:
+        if JIRA_CLIENT is None:
+            JIRA_CLIENT = JIRA(
+                JIRA_HOST,
+                basic_auth=(JIRA_USERNAME, JIRA_PASSWORD),
+                transition_cache_ttl=JIRA_TRANSITION_CACHE_TTL,
+                option_store=JiraOptionStore() if JIRA_OPTION_MIRROR else None,
+                request_rate=JIRA_REQUEST_RATE,
+            )
+        return JIRA_CLIENT
+
+
+class JiraOptionStore:
+    # Mirror of the Jira custom field options, the Jira client uses it instead of listing all options again
+    def get_context(self, field):
+        try:
+            with POSTGRES_POOL.connection() as connection:
                 with connection.cursor() as cursor:
-                    cursor.execute(SELECT_AVAILABLE_PACKAGES_QUERY, ('Linux',))
-                    for package_name, package_version in cursor:
-                        to_add = 1 if package_name in linux_packages else 3
-                        if linux_packages_total + to_add >= JIRA.FIELD_OPTIONS_LIMIT:
-                            break
-                        linux_packages_total += to_add
-                        linux_packages.setdefault(package_name, []).append(package_version)
+                    cursor.execute(POSTGRES_POOL.statement('select_jira_field_contexts'), (field,))
+                    row = cursor.fetchone()
+        except:
+            log.warning('Jira: Failed to read mirrored context of field %s.', field, exc_info=True)
+            return None
+        return row[0] if row else None
+
+    def set_context(self, field, context):
+        try:
+            with POSTGRES_POOL.connection() as connection:
                 with connection.cursor() as cursor:
-                    cursor.execute(SELECT_AVAILABLE_PACKAGES_QUERY, ('Windows',))
-                    for package_name, package_version in cursor:
-                        to_add = 1 if package_name in windows_packages else 3
-                        if windows_packages_total + to_add >= JIRA.FIELD_OPTIONS_LIMIT:
-                            break
-                        windows_packages_total += to_add
-                        windows_packages.setdefault(package_name, []).append(package_version)
+                    if context is None:
+                        cursor.execute(POSTGRES_POOL.statement('delete_jira_field_options'), (field,))
+                        cursor.execute(POSTGRES_POOL.statement('delete_jira_field_contexts'), (field,))
+                    else:
+                        cursor.execute(POSTGRES_POOL.statement('insert_jira_field_contexts'), (field, context))
         except:
-            log.error('Sync: Failed to communicate with the database.', exc_info=True)
-            return False
-
-        log.info('Sync: Preparing data to be sent to Jira.')
-        all_minions = sorted(linux_minions + windows_minions)
-        linux_minions = sorted(linux_minions)
-        windows_minions = sorted(windows_minions)
-        for package_name, package_versions in linux_packages.items():
-            tail = sorted(package_versions, key=split_version, reverse=True)
-            linux_packages[package_name] = ['Remove'] + [version for version in tail if version.lower() != 'remove']
-        for package_name, package_versions in windows_packages.items():
-            tail = sorted(package_versions, key=split_version, reverse=True)
-            windows_packages[package_name] = ['Remove'] + [version for version in tail if version.lower() != 'remove']
-        linux_packages = dict(sorted(linux_packages.items(), key=lambda item: item[0]))
-        windows_packages = dict(sorted(windows_packages.items(), key=lambda item: item[0]))
+            log.warning('Jira: Failed to mirror context of field %s.', field, exc_info=True)
 
+    def get_options(self, field, context):
         try:
-            log.info('Sync: Getting custom fields from Jira.')
-            jira = JIRA(JIRA_HOST, basic_auth=(JIRA_USERNAME, JIRA_PASSWORD))
-            fields = {field['name']: field for field in jira.fields()}
-
-            # Populate minions
-            all_minions_field = fields.get(JIRA_ALL_MINIONS_FIELD)
-            if all_minions_field is None:
-                all_minions_field = jira.create_custom_field(
-                    name=JIRA_ALL_MINIONS_FIELD,
-                    description='The ID of the Salt minions.',
-                    type=CustomFieldType.MULTI_SELECT,
-                    searcherKey=CustomFieldSearcherKey.MULTI_SELECT,
-                )
-            log.info('Sync: Clearing current field options for %s on Jira.', JIRA_ALL_MINIONS_FIELD)
-            jira.clear_custom_field_options(all_minions_field['id'])
-            log.info('Sync: Populating field options for %s on Jira.', JIRA_ALL_MINIONS_FIELD)
-            jira.set_custom_field_options(all_minions_field['id'], all_minions)
-
-            # Populate Linux minions
-            linux_minions_field = fields.get(JIRA_LINUX_MINIONS_FIELD)
-            if linux_minions_field is None:
-                linux_minions_field = jira.create_custom_field(
-                    name=JIRA_LINUX_MINIONS_FIELD,
-                    description='The ID of the Salt minions.',
-                    type=CustomFieldType.MULTI_SELECT,
-                    searcherKey=CustomFieldSearcherKey.MULTI_SELECT,
-                )
-            log.info('Sync: Clearing current field options for %s on Jira.', JIRA_LINUX_MINIONS_FIELD)
-            jira.clear_custom_field_options(linux_minions_field['id'])
-            log.info('Sync: Populating field options for %s on Jira.', JIRA_LINUX_MINIONS_FIELD)
-            jira.set_custom_field_options(linux_minions_field['id'], linux_minions)
-
-            # Populate Windows minions
-            windows_minions_field = fields.get(JIRA_WINDOWS_MINIONS_FIELD)
-            if windows_minions_field is None:
-                windows_minions_field = jira.create_custom_field(
-                    name=JIRA_WINDOWS_MINIONS_FIELD,
-                    description='The ID of the Salt minions.',
-                    type=CustomFieldType.MULTI_SELECT,
-                    searcherKey=CustomFieldSearcherKey.MULTI_SELECT,
-                )
-            log.info('Sync: Clearing current field options for %s on Jira.', JIRA_WINDOWS_MINIONS_FIELD)
-            jira.clear_custom_field_options(windows_minions_field['id'])
-            log.info('Sync: Populating field options for %s on Jira.', JIRA_WINDOWS_MINIONS_FIELD)
-            jira.set_custom_field_options(windows_minions_field['id'], windows_minions)
-
-            # Populate Linux packages
-            linux_packages_field = fields.get(JIRA_LINUX_PACKAGE_FIELD)
-            if linux_packages_field is None:
-                linux_packages_field = jira.create_custom_field(
-                    name=JIRA_LINUX_PACKAGE_FIELD,
-                    description='The system package and version to install, upgrade or downgrade to, or remove.',
-                    type=CustomFieldType.CASCADING_SELECT,
-                    searcherKey=CustomFieldSearcherKey.CASCADING_SELECT,
-                )
-            log.info('Sync: Clearing current field options for %s on Jira.', JIRA_LINUX_PACKAGE_FIELD)
-            jira.clear_custom_field_options(linux_packages_field['id'])
-            log.info('Sync: Populating field options for %s on Jira.', JIRA_LINUX_PACKAGE_FIELD)
-            jira.set_custom_field_options(linux_packages_field['id'], linux_packages)
-
-            # Populate Windows packages
-            windows_packages_field = fields.get(JIRA_WINDOWS_PACKAGE_FIELD)
-            if windows_packages_field is None:
-                windows_packages_field = jira.create_custom_field(
-                    name=JIRA_WINDOWS_PACKAGE_FIELD,
-                    description='The system package and version to install, upgrade or downgrade to, or remove.',
-                    type=CustomFieldType.CASCADING_SELECT,
-                    searcherKey=CustomFieldSearcherKey.CASCADING_SELECT,
-                )
-            log.info('Sync: Clearing current field options for %s on Jira.', JIRA_WINDOWS_PACKAGE_FIELD)
-            jira.clear_custom_field_options(windows_packages_field['id'])
-            log.info('Sync: Populating field options for %s on Jira.', JIRA_WINDOWS_PACKAGE_FIELD)
-            jira.set_custom_field_options(windows_packages_field['id'], windows_packages)
+            with POSTGRES_POOL.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(POSTGRES_POOL.statement('select_jira_field_contexts'), (field,))
+                    row = cursor.fetchone()
+                    if not row or row[0] != context or row[1] is None:
+                        return None
+                    cursor.execute(POSTGRES_POOL.statement('select_jira_field_options'), (field, context))
+                    rows = cursor.fetchall()
         except:
-            log.error('Sync: Failed to send data to Jira.', exc_info=True)
-            return False
+            log.warning('Jira: Failed to read mirrored options of field %s.', field, exc_info=True)
+            return None
+
+        options = []
+        for option_id, value, parent_id, disabled in rows:
+            option = {'id': option_id, 'value': value, 'disabled': disabled}
+            if parent_id is not None:
+                option['optionId'] = parent_id
+            options.append(option)
+        return options if len(options) == row[1] else None
+
+    def set_options(self, field, context, options):
+        # Options without a context invalidate the mirror of the field, the change on Jira stops when that fails
+        if options is None:
+            try:
+                with POSTGRES_POOL.connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(POSTGRES_POOL.statement('invalidate_jira_field_contexts'), (field,))
+            except:
+                log.error('Jira: Failed to invalidate mirrored options of field %s.', field, exc_info=True)
+                raise
+            return
+        try:
+            with POSTGRES_POOL.connection() as connection:
+                with connection.cursor() as cursor:
+                    positions = collections.Counter()
+                    columns = ([], [], [], [], [])
+                    for option in options:
+                        parent_id = option.get('optionId')
+                        values = (option['id'], option['value'], parent_id, positions[parent_id],
+                                  option.get('disabled', False))
+                        positions[parent_id] += 1
+                        for column, value in zip(columns, values):
+                            column.append(value)
+                    cursor.execute(POSTGRES_POOL.statement('delete_jira_field_options'), (field,))
+                    cursor.execute(POSTGRES_POOL.statement('insert_jira_field_options'), (field, context, *columns))
+                    values = (len(options), field, context)
+                    cursor.execute(POSTGRES_POOL.statement('update_jira_field_contexts'), values)
+        except:
+            log.warning('Jira: Failed to mirror options of field %s.', field, exc_info=True)
+
+
+def sync_field_options(jira, field_id, field_name, options, fingerprints):
+    stage = f'jira:{field_id}'
+    stage_fingerprint = fingerprint(options)
+    if fingerprints.get(stage) == stage_fingerprint:
+        log.info('Sync: Skipping unchanged field options for %s on Jira.', field_name)
+        return
+
+    push_field_options(jira, field_id, field_name, options)
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement('insert_sync_fingerprints'), (stage, stage_fingerprint))
+    except:
+        log.warning('Sync: Failed to store fingerprint of field options for %s.', field_name, exc_info=True)
 
-        log.info('Sync: Finished.')
-        return True
+
+def push_field_options(jira, field_id, field_name, options):
+    if JIRA_SYNC_MODE == 'replace':
+        # Setting the options deletes the current options first
+        log.info('Sync: Replacing field options for %s on Jira.', field_name)
+        jira.set_custom_field_options(field_id, options)
+        return
+
+    log.info('Sync: Reconciling field options for %s on Jira.', field_name)
+    stats = jira.reconcile_custom_field_options(field_id, options)
+    log.info('Sync: Reconciled field options for %s on Jira with %s created, %s updated, %s deleted and %s moved.',
+             field_name, stats['created'], stats['updated'], stats['deleted'], stats['moved'])
+
+
+def fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
 
 
 def jsonify_clear(response):
@@ -733,17 +2257,242 @@ def jsonify_clear(response):
         del response['successes']
     if 'failures' in response and not response['failures']:
         del response['failures']
+    if 'waves' in response and not response['waves']:
+        del response['waves']
     return response
 
 
-def split_version(version):
-    parts = RE_SPLIT_VERSION.split(version)
-    for index, part in enumerate(parts):
-        try:
-            parts[index] = '{0:010d}'.format(int(part))
-        except:
-            pass
-    return parts
+def compensate_install_packages(operation, itsm_id, statement, values):
+    # Undoes a committed request whose Jira issue could not be transitioned
+    log.info('%s:%s: Undoing package management request in the database.', operation, itsm_id)
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement(statement), values)
+    except:
+        log.error('%s:%s: Failed to undo package management request in the database.', operation, itsm_id,
+                  exc_info=True)
+
+
+def insert_install_packages(connection, rows):
+    # Rows with invalid values are filtered out by the query and reported as not inserted
+    rows = [row for row in rows if all(isinstance(value, str) for value in row[:3])]
+    if not rows:
+        return set()
+    columns = [list(column) for column in zip(*rows)]
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_POOL.statement('insert_install_packages_bulk'), columns)
+        return set(cursor.fetchall())
+
+
+def dispatch_job(pepper, minion_ids, fun, arg=None, coalesce=False):
+    successes, failures = {}, []
+    if not minion_ids:
+        return successes, failures
+
+    # Requests for the same job within the coalescing window share a single job per minion
+    if coalesce and SALT_COALESCE_WINDOW > 0:
+        key = (fun, tuple(arg or ()))
+        with COALESCE_LOCK:
+            batch = COALESCE_BATCHES.get(key)
+            if batch is None:
+                batch = COALESCE_BATCHES[key] = {'minion_ids': set(), 'future': concurrent.futures.Future()}
+                timer = threading.Timer(SALT_COALESCE_WINDOW, flush_coalesced_job, (key,))
+                timer.daemon = True
+                timer.start()
+            batch['minion_ids'].update(minion_ids)
+        batch_successes, _ = batch['future'].result()
+        successes = {minion_id: batch_successes[minion_id] for minion_id in minion_ids if minion_id in batch_successes}
+        failures = [minion_id for minion_id in minion_ids if minion_id not in successes]
+        return successes, failures
+
+    # Legacy mode, one job per minion
+    if SALT_DISPATCH_MODE == 'minion':
+        for minion_id in minion_ids:
+            try:
+                result = pepper.local_async(minion_id, fun, arg)
+                if not result['return'][0]:
+                    failures.append(minion_id)
+                    continue
+                successes[minion_id] = result['return'][0]['jid']
+            except:
+                log.error('Dispatch: Failed to request job %s for %s.', fun, minion_id, exc_info=True)
+                failures.append(minion_id)
+        return successes, failures
+
+    # List mode, one job per chunk of minions sent in a single request
+    try:
+        result = pepper.local_async_list(minion_ids, fun, arg, chunk_size=SALT_DISPATCH_CHUNK_SIZE)
+        for data in result['return']:
+            if not data:
+                continue
+            for minion_id in data.get('minions', []):
+                successes[minion_id] = data['jid']
+    except:
+        log.error('Dispatch: Failed to request job %s for %s minions.', fun, len(minion_ids), exc_info=True)
+    failures = [minion_id for minion_id in minion_ids if minion_id not in successes]
+    return successes, failures
+
+
+def flush_coalesced_job(key):
+    with COALESCE_LOCK:
+        batch = COALESCE_BATCHES.pop(key)
+    fun, arg = key
+    minion_ids = sorted(batch['minion_ids'])
+    log.info('Dispatch: Requesting coalesced job %s for %s minions.', fun, len(minion_ids))
+    try:
+        result = dispatch_job(SALT_SESSION.connect(), minion_ids, fun, arg)
+    except:
+        log.error('Dispatch: Failed to request coalesced job %s for %s minions.', fun, len(minion_ids), exc_info=True)
+        result = {}, minion_ids
+    batch['future'].set_result(result)
+
+
+def dispatch_batch(pepper, minion_ids, fun, arg, max_in_flight):
+    # Batch mode, Salt runs the job on at most max_in_flight minions at a time and returns once all of them finished
+    returns = {}
+    try:
+        result = pepper.local_batch(minion_ids, fun, arg, tgt_type='list', batch=str(max_in_flight))
+        for data in result['return']:
+            if isinstance(data, dict):
+                returns.update(data)
+    except:
+        log.error('Dispatch: Failed to run batch job %s for %s minions.', fun, len(minion_ids), exc_info=True)
+    # Batch returns only carry the job ID when Salt sends full returns
+    successes = {minion_id: returns[minion_id].get('jid') if isinstance(returns[minion_id], dict) else None
+                 for minion_id in minion_ids if minion_id in returns and is_successful(returns[minion_id])}
+    failures = [minion_id for minion_id in minion_ids if minion_id not in successes]
+    return successes, failures
+
+
+def is_successful(data):
+    # Full and batch returns carry the return code next to the return, it decides when present
+    if isinstance(data, dict) and 'retcode' in data:
+        return data['retcode'] == 0
+    # State runs return their state results, rendering errors are returned as a list of strings
+    return isinstance(data, dict) and all(state.get('result') is not False
+                                          for state in data.values() if isinstance(state, dict))
+
+
+def run_rollout(pepper, operation, itsm_id, minion_ids, fun, arg, rollout, job_id=None):
+    # Minions are applied wave by wave, the rollout halts once the failures exceed the threshold,
+    # returns the job IDs, the failures and the wave of every minion that ran
+    label = operation.capitalize()
+    successes, failures, minion_waves = {}, [], {}
+    if not minion_ids:
+        return successes, failures, minion_waves
+    minion_ids = sorted(minion_ids)
+    batch_size = max(1, resolve_amount(rollout['batch'], len(minion_ids)))
+    max_in_flight = max(1, min(rollout['max_in_flight'], batch_size))
+    threshold = resolve_amount(rollout['failure_threshold'], len(minion_ids))
+    waves = [minion_ids[index:index + batch_size] for index in range(0, len(minion_ids), batch_size)]
+
+    try:
+        wave_ids = []
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                for wave, wave_minion_ids in enumerate(waves, 1):
+                    values = (job_id, itsm_id, operation, wave, wave_minion_ids)
+                    cursor.execute(POSTGRES_POOL.statement('insert_rollout_waves'), values)
+                    wave_ids.append(cursor.fetchone()[0])
+    except:
+        log.error('%s:%s: Failed to store rollout waves in the database.', label, itsm_id, exc_info=True)
+        return successes, minion_ids, minion_waves
+
+    log.info('%s:%s: Rolling out to %s minions in %s waves of %s, at most %s in flight.',
+             label, itsm_id, len(minion_ids), len(waves), batch_size, max_in_flight)
+    for wave, (wave_id, wave_minion_ids) in enumerate(zip(wave_ids, waves), 1):
+        if len(failures) > threshold:
+            log.error('%s:%s: Halting rollout after %s failures, skipping %s waves.',
+                      label, itsm_id, len(failures), len(waves) - wave + 1)
+            failures.extend(minion_id for skipped in waves[wave - 1:] for minion_id in skipped)
+            update_rollout_wave('skip_rollout_waves', (wave_ids[wave - 1:],))
+            break
+
+        update_job_stage(job_id, f'rollout_wave_{wave}')
+        log.info('%s:%s: Running rollout wave %s of %s on %s minions.', label, itsm_id, wave, len(waves),
+                 len(wave_minion_ids))
+        update_rollout_wave('start_rollout_waves', (wave_id,))
+        wave_successes, wave_failures = dispatch_batch(pepper, wave_minion_ids, fun, arg, max_in_flight)
+        successes.update(wave_successes)
+        failures.extend(wave_failures)
+        minion_waves.update((minion_id, wave) for minion_id in wave_minion_ids)
+        values = ('failed' if wave_failures else 'succeeded', len(wave_successes), len(wave_failures), wave_id)
+        update_rollout_wave('finish_rollout_waves', values)
+    return successes, failures, minion_waves
+
+
+def update_rollout_wave(statement, values):
+    try:
+        with POSTGRES_POOL.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_POOL.statement(statement), values)
+    except:
+        log.warning('Rollout: Failed to update rollout waves in the database.', exc_info=True)
+
+
+def parse_rollout(rollout):
+    if not rollout:
+        return None
+    if not isinstance(rollout, dict):
+        raise ValueError(rollout)
+    return {
+        'batch': parse_amount(rollout.get('batch'), 1),
+        'max_in_flight': parse_amount(rollout.get('max_in_flight', SALT_ROLLOUT_MAX_IN_FLIGHT), 1, percentage=False),
+        'failure_threshold': parse_amount(rollout.get('failure_threshold', SALT_ROLLOUT_FAILURE_THRESHOLD), 0),
+    }
+
+
+def parse_amount(amount, minimum, percentage=True):
+    # Amounts are either a number of minions or a percentage of the targeted minions like '10%'
+    if percentage and isinstance(amount, str) and amount.endswith('%'):
+        value = float(amount[:-1])
+        if not 0 <= value <= 100 or (minimum and not value):
+            raise ValueError(amount)
+        return amount
+    if isinstance(amount, str) and amount.isdigit():
+        amount = int(amount)
+    if isinstance(amount, bool) or not isinstance(amount, int) or amount < minimum:
+        raise ValueError(amount)
+    return amount
+
+
+def resolve_amount(amount, total):
+    if isinstance(amount, str):
+        return int(total * float(amount[:-1]) / 100)
+    return amount
+
+
+def invalidate_pillar(pepper, minion_ids):
+    # Only minions whose package requests changed lose their cached pillar, returns the minions that failed
+    minion_ids = sorted(set(minion_ids))
+    if not SALT_PILLAR_CACHE or not minion_ids:
+        return []
+    if len(minion_ids) > SALT_PILLAR_CACHE_CLEAR_ALL:
+        kwargs_list = [{'minion': '*'}]
+    else:
+        kwargs_list = [{'minion': minion_id} for minion_id in minion_ids]
+    try:
+        returns = pepper.runner_list('pillar.clear_pillar_cache', kwargs_list)['return']
+    except:
+        log.error('Pillar: Failed to clear cached pillar for %s minions.', len(minion_ids), exc_info=True)
+        return minion_ids
+    # Runner errors come back as messages in place of the return, one return per lowstate
+    failures = []
+    for index, kwargs in enumerate(kwargs_list):
+        data = returns[index] if index < len(returns) else False
+        if isinstance(data, dict) and data.get('success') is False:
+            data = False
+        if data is False or isinstance(data, str):
+            failures.extend(minion_ids if kwargs['minion'] == '*' else [kwargs['minion']])
+    if failures:
+        log.error('Pillar: Failed to clear cached pillar for %s minions.', len(failures))
+    return failures
+
+
+def is_due(after):
+    now = datetime.datetime.now(after.tzinfo) if after.tzinfo else datetime.datetime.now()
+    return after <= now
 
 
 def isoparse(timestamp):
@@ -754,5 +2503,27 @@ def isoparse(timestamp):
     return None
 
 
+# Operations that can run inline or as queued jobs
+OPERATIONS = {
+    'install': run_install,
+    'remove': run_remove,
+    'revert': run_revert,
+    'reboot': run_reboot,
+}
+
+# Request parsers of the operations, shared with bulk requests
+PARSERS = {
+    'install': parse_install,
+    'remove': parse_remove,
+    'revert': parse_revert,
+    'reboot': parse_reboot,
+}
+
+# Start background job workers
+start_job_workers()
+start_scheduler_worker()
+start_event_listener()
+
+
 if __name__ == '__main__':
     app.run(debug=os.environ.get('FLASK_ENV') == 'development')
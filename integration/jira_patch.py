@@ -1,10 +1,16 @@
+import bisect
 import concurrent.futures
+import email.utils
 import json
 import queue
+import random
+import re
+import threading
 import time
 
 from jira import JIRA as JIRABase
 from jira.client import translate_resource_args
+from jira.exceptions import JIRAError
 from jira.utils import json_loads
 from requests.adapters import HTTPAdapter
 
@@ -57,19 +63,164 @@ class CustomFieldSearcherKey:
     VERSION = 'com.atlassian.jira.plugin.system.customfieldtypes:versionsearcher'
 
 
+class RequestScheduler:
+    BACKOFF_BASE = 1
+    BACKOFF_MAX = 60
+    LATENCY_FACTOR = 2
+    LATENCY_SMOOTHING = 0.2
+    LATENCY_BASELINE_DRIFT = 0.01
+    DECREASE_FACTOR = 0.5
+    SLOW_DECREASE_FACTOR = 0.9
+
+    def __init__(self, rate, burst, max_concurrency, max_retries, min_concurrency=1):
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._condition = threading.Condition()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._limit = float(max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0
+        self._latency = None
+        self._latency_min = None
+        self._stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0}
+
+    def call(self, function, *args, **kwargs):
+        # Retryable failures back off exponentially with full jitter, a Retry-After header pauses all requests
+        attempt = 0
+        while True:
+            self._acquire()
+            start = time.monotonic()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as exc:
+                status, retry_after = self._inspect(exc)
+                retryable = status is None or status in (408, 429) or status >= 500
+                self._release(time.monotonic() - start, congested=retryable, retry_after=retry_after)
+                attempt += 1
+                if not retryable or attempt > self.max_retries:
+                    with self._condition:
+                        self._stats['failures'] += 1
+                    raise
+                with self._condition:
+                    self._stats['retries'] += 1
+                    self._stats['throttled'] += int(status in (429, 503))
+                delay = random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
+                time.sleep(max(delay, retry_after or 0))
+                continue
+            self._release(time.monotonic() - start)
+            return result
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+            stats['concurrency'] = round(self._limit, 2)
+            stats['latency'] = self._latency
+        return stats
+
+    def _acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._paused_until:
+                    timeout = self._paused_until - now
+                elif self._in_flight >= int(self._limit):
+                    timeout = None
+                elif self._tokens < 1:
+                    timeout = (1 - self._tokens) / self.rate
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    self._stats['requests'] += 1
+                    return
+                self._condition.wait(timeout)
+
+    def _release(self, latency, congested=False, retry_after=None):
+        # Concurrency grows by one per window of successful requests and shrinks on throttling or slow responses
+        with self._condition:
+            self._in_flight -= 1
+            if congested:
+                self._limit = max(self.min_concurrency, self._limit * self.DECREASE_FACTOR)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            else:
+                if self._latency is None:
+                    self._latency = latency
+                else:
+                    self._latency += self.LATENCY_SMOOTHING * (latency - self._latency)
+                # The baseline slowly follows the latency so a lasting slowdown of the server is accepted eventually
+                baseline = self._latency if self._latency_min is None else self._latency_min
+                drift = self.LATENCY_BASELINE_DRIFT * (self._latency - baseline)
+                self._latency_min = min(self._latency, baseline + drift)
+                if self._latency > self.LATENCY_FACTOR * self._latency_min:
+                    self._limit = max(self.min_concurrency, self._limit * self.SLOW_DECREASE_FACTOR)
+                else:
+                    self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    @staticmethod
+    def _inspect(exc):
+        response = getattr(exc, 'response', None)
+        status = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+        header = response.headers.get('Retry-After') if response is not None else None
+        if not header:
+            return status, None
+        try:
+            return status, max(0.0, float(header))
+        except ValueError:
+            pass
+        try:
+            return status, max(0.0, email.utils.parsedate_to_datetime(header).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return status, None
+
+
 class JIRA(JIRABase):
     REQUEST_LIMIT = 1000
     REQUEST_WORKERS = 10
-    REQUEST_MAX_RETRIES = 20
-    REQUEST_RETRY_INTERVAL = 10
+    REQUEST_MAX_RETRIES = 10
+    REQUEST_RATE = 10
+    REQUEST_BURST = 20
     FIELD_OPTIONS_LIMIT = 10000
+    TRANSITION_CACHE_TTL = 3600
+    INVALID_TRANSITION = re.compile(r'transition id .* is not valid|workflow operation .* is not valid', re.IGNORECASE)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, transition_cache_ttl=None, option_store=None, request_rate=None, **kwargs):
+        # Retries and backoff are left to the request scheduler, the session only sends each request once
+        kwargs.setdefault('max_retries', 0)
         # Patch requests to change the size of the connection pool
         super().__init__(*args, **kwargs)
         adapter = HTTPAdapter(pool_connections=JIRA.REQUEST_WORKERS, pool_maxsize=JIRA.REQUEST_WORKERS)
         self._session.mount('http://', adapter)
         self._session.mount('https://', adapter)
+        # Option requests of all threads share one scheduler
+        request_rate = JIRA.REQUEST_RATE if request_rate is None else request_rate
+        self._scheduler = RequestScheduler(request_rate, max(JIRA.REQUEST_BURST, request_rate), JIRA.REQUEST_WORKERS,
+                                           JIRA.REQUEST_MAX_RETRIES)
+        self._transition_cache_ttl = JIRA.TRANSITION_CACHE_TTL if transition_cache_ttl is None else transition_cache_ttl
+        self._transition_cache = {}
+        self._transition_lock = threading.Lock()
+        self._option_store = option_store
+
+    def transition_issue(self, issue, transition, *args, **kwargs):
+        try:
+            return super().transition_issue(issue, transition, *args, **kwargs)
+        except JIRAError as exc:
+            # A cached transition ID may not be valid from the current status of the issue, other errors are not retried
+            if not self._is_invalid_transition(exc) or not self._invalidate_transitions(issue):
+                raise
+        return super().transition_issue(issue, transition, *args, **kwargs)
+
+    @staticmethod
+    def _is_invalid_transition(exc):
+        text = exc.text or (exc.response.text if exc.response is not None else '') or ''
+        return exc.status_code == 400 and JIRA.INVALID_TRANSITION.search(text) is not None
 
     @translate_resource_args
     def transitions(self, issue, id=None, expand=None):
@@ -84,10 +235,29 @@ class JIRA(JIRABase):
         return response
 
     def find_transitionid_by_name(self, issue, name, **kwargs):
-        for transition in self.transitions(issue, **kwargs):
-            if transition['name'].lower() == name.lower():
-                return transition['id']
-        return None
+        key = self._transition_cache_key(issue)
+        with self._transition_lock:
+            expire, transition_ids = self._transition_cache.get(key, (0, {}))
+        if time.monotonic() < expire and name.lower() in transition_ids:
+            return transition_ids[name.lower()]
+
+        transitions = self.transitions(issue, **kwargs)
+        transition_ids = {transition['name'].lower(): transition['id'] for transition in transitions}
+        with self._transition_lock:
+            self._transition_cache[key] = (time.monotonic() + self._transition_cache_ttl, transition_ids)
+        return transition_ids.get(name.lower())
+
+    def _transition_cache_key(self, issue):
+        # Workflows are assigned per project and issue type, the issue type is only known from issue objects
+        # since looking it up would cost the request the cache saves, so issue keys share their project's entry
+        issue_type = getattr(getattr(getattr(issue, 'fields', None), 'issuetype', None), 'id', None)
+        issue = str(getattr(issue, 'key', issue))
+        project = issue.rsplit('-', 1)[0] if '-' in issue else issue
+        return project, issue_type
+
+    def _invalidate_transitions(self, issue):
+        with self._transition_lock:
+            return self._transition_cache.pop(self._transition_cache_key(issue), None) is not None
 
     def create_custom_field(self, name=None, description=None, type=None, searcherKey=None):
         data = {}
@@ -107,12 +277,16 @@ class JIRA(JIRABase):
         context = self._get_custom_field_context(field)
         if not context:
             raise ValueError('Custom field context not found')
+        if not isinstance(options, (list, dict)):
+            raise TypeError('\'options\' must be a list or a dict')
         self._delete_custom_field_options(field, context)
+        self._invalidate_custom_field_options(field)
         if isinstance(options, list):
-            return self._create_custom_field_options(field, context, options)
-        if isinstance(options, dict):
-            return self._create_custom_field_options_cascading(field, context, options)
-        raise TypeError('\'options\' must be a list or a dict')
+            response = self._create_custom_field_options(field, context, options)
+        else:
+            response = self._create_custom_field_options_cascading(field, context, options)
+        self._store_custom_field_options(field, context, response['options'])
+        return response
 
     def clear_custom_field_options(self, field):
         context = self._get_custom_field_context(field)
@@ -120,85 +294,253 @@ class JIRA(JIRABase):
             raise ValueError('Custom field context not found')
         self._delete_custom_field_options(field, context)
 
+    def reconcile_custom_field_options(self, field, options):
+        context = self._get_custom_field_context(field)
+        if not context:
+            raise ValueError('Custom field context not found')
+        if not isinstance(options, (list, dict)):
+            raise TypeError('\'options\' must be a list or a dict')
+        current = self._get_mirrored_custom_field_options(field, context)
+        if current is None:
+            current = self._get_all_custom_field_options(field, context)
+        self._invalidate_custom_field_options(field)
+        if isinstance(options, list):
+            stats, result = self._reconcile_custom_field_options(field, context, options, current)
+        else:
+            stats, result = self._reconcile_custom_field_options_cascading(field, context, options, current)
+        self._store_custom_field_options(field, context, result)
+        return stats
+
+    def request_stats(self):
+        return self._scheduler.stats()
+
     def _get_custom_field_context(self, field):
+        if self._option_store is not None:
+            context = self._option_store.get_context(field)
+            if context is not None:
+                return context
         url = self._get_url(f'field/{field}/context')
-        response = json_loads(self._session.get(url))
+        response = json_loads(self._scheduler.call(self._session.get, url))
         if 'values' not in response:
             return None
-        return response['values'][0]['id']
+        context = response['values'][0]['id']
+        if self._option_store is not None:
+            self._option_store.set_context(field, context)
+        return context
 
-    def _create_custom_field_options(self, field, context, options):
-        data = [{'value': option} for option in set(options)]
-        response = self._create_all_custom_field_options(field, context, data)
+    def _call_custom_field_context(self, field, method, url, **kwargs):
+        try:
+            return self._scheduler.call(method, url, **kwargs)
+        except JIRAError as exc:
+            # The mirrored context may have been deleted, it is looked up again next time
+            if exc.status_code == 404 and self._option_store is not None:
+                self._option_store.set_context(field, None)
+            raise
 
-        # Reorder options
-        order = self._sort_fields(options, response['options'])
-        self._reorder_all_custom_field_options(field, context, order)
+    def _count_custom_field_options(self, field, context):
+        url = self._get_url(f'field/{field}/context/{context}/option?maxResults=1')
+        response = json_loads(self._call_custom_field_context(field, self._session.get, url))
+        return response.get('total')
 
-        return response
+    def _get_mirrored_custom_field_options(self, field, context):
+        # Mirrored options are only used while Jira reports the same number of options
+        if self._option_store is None:
+            return None
+        options = self._option_store.get_options(field, context)
+        if options is None or self._count_custom_field_options(field, context) != len(options):
+            return None
+        return options
+
+    def _invalidate_custom_field_options(self, field):
+        # Options are not mirrored while they are being changed, an interrupted change leaves no stale mirror behind
+        if self._option_store is not None:
+            self._option_store.set_options(field, None, None)
+
+    def _store_custom_field_options(self, field, context, options):
+        # Options are stored in their order on Jira, children after their parent
+        if self._option_store is None:
+            return
+        parents = [option for option in options if 'optionId' not in option]
+        children = {}
+        for option in options:
+            if 'optionId' in option:
+                children.setdefault(option['optionId'], []).append(option)
+        ordered = []
+        for option in parents:
+            ordered.append({'id': option['id'], 'value': option['value'], 'disabled': option.get('disabled', False)})
+            ordered.extend({'id': child['id'], 'value': child['value'], 'optionId': option['id'],
+                            'disabled': child.get('disabled', False)} for child in children.get(option['id'], []))
+        self._option_store.set_options(field, context, ordered)
+
+    def _create_custom_field_options(self, field, context, options):
+        # Options are appended in the order they are created, no reordering is needed afterwards
+        data = [{'value': option} for option in dict.fromkeys(options)]
+        return self._create_all_custom_field_options(field, context, data)
 
     def _create_custom_field_options_cascading(self, field, context, options):
         # Create parent options
         options = {key: value for key, value in options.items() if value}
-        data = [{'value': option} for option in set(options.keys())]
+        data = [{'value': option} for option in options.keys()]
         parents = self._create_all_custom_field_options(field, context, data)['options']
         parent_ids = {option['value']: option['id'] for option in parents}
 
-        # Create child options
+        # Create child options of all parents at once, children are appended to their own parent
         data = []
         for parent_value, child_options in options.items():
             parent_id = parent_ids.get(parent_value)
-            data.extend([{'value': option, 'optionId': parent_id} for option in set(child_options)])
+            data.extend([{'value': option, 'optionId': parent_id} for option in dict.fromkeys(child_options)])
         children = self._create_all_custom_field_options(field, context, data)['options']
 
-        # Reorder options
-        def reorder_worker(order):
-            self._reorder_all_custom_field_options(field, context, order)
-        parent_order, child_orders = self._sort_fields_cascading(options, parents, children)
-        self._reorder_all_custom_field_options(field, context, parent_order)
-        with concurrent.futures.ThreadPoolExecutor(JIRA.REQUEST_WORKERS) as executor:
-            executor.map(reorder_worker, child_orders)
-
         return {'options': parents + children}
 
+    def _reconcile_custom_field_options(self, field, context, options, current):
+        options = list(dict.fromkeys(options))[:JIRA.FIELD_OPTIONS_LIMIT]
+        current = [option for option in current if 'optionId' not in option]
+        stats = {'created': 0, 'updated': 0, 'deleted': 0, 'moved': 0}
+
+        # Update, delete and create options
+        plan = self._plan_custom_field_options(options, current)
+        self._apply_custom_field_options_plans(field, context, [plan], stats)
+        data = [{'value': value} for value in plan['added']]
+        created = self._create_all_custom_field_options(field, context, data)['options']
+        stats['created'] += len(created)
+
+        # Move options that are out of order, new options are appended at the end
+        order = plan['kept'] + [option['id'] for option in created]
+        desired = self._sort_fields(options, plan['existing'] + created)
+        stats['moved'] += self._move_custom_field_options(field, context, order, desired)
+
+        values = {option['id']: option['value'] for option in plan['existing'] + created}
+        return stats, [{'id': option_id, 'value': values[option_id]} for option_id in desired]
+
+    def _reconcile_custom_field_options_cascading(self, field, context, options, current):
+        options = {key: list(dict.fromkeys(value)) for key, value in options.items() if value}
+        current_parents = [option for option in current if 'optionId' not in option]
+        current_children = {}
+        for option in current:
+            if 'optionId' in option:
+                current_children.setdefault(option['optionId'], []).append(option)
+        stats = {'created': 0, 'updated': 0, 'deleted': 0, 'moved': 0}
+
+        # Update, delete and create parent options, deleting a parent also deletes its children
+        parent_plan = self._plan_custom_field_options(list(options.keys()), current_parents)
+        child_plans = {}
+        for option in parent_plan['existing']:
+            children = current_children.get(option['id'], [])
+            child_plans[option['id']] = self._plan_custom_field_options(options[option['value']], children)
+        plans = list(child_plans.values()) + [parent_plan]
+        self._apply_custom_field_options_plans(field, context, plans, stats)
+        data = [{'value': value} for value in parent_plan['added']]
+        created_parents = self._create_all_custom_field_options(field, context, data)['options']
+        stats['created'] += len(created_parents)
+        parents = parent_plan['existing'] + created_parents
+        parent_ids = {option['value']: option['id'] for option in parents}
+
+        # Create child options of all parents at once
+        data = []
+        for parent_value, child_options in options.items():
+            parent_id = parent_ids[parent_value]
+            added = child_plans[parent_id]['added'] if parent_id in child_plans else child_options
+            data.extend([{'value': value, 'optionId': parent_id} for value in added])
+        created_children = {}
+        for option in self._create_all_custom_field_options(field, context, data)['options']:
+            created_children.setdefault(option['optionId'], []).append(option)
+            stats['created'] += 1
+
+        # Move options that are out of order, children of new parents were created in order
+        order = parent_plan['kept'] + [option['id'] for option in created_parents]
+        desired = self._sort_fields(options.keys(), parents)
+        stats['moved'] += self._move_custom_field_options(field, context, order, desired)
+        result = [{'id': option['id'], 'value': option['value']} for option in self._sort_options(desired, parents)]
+        for option in parents:
+            created = created_children.get(option['id'], [])
+            children = created
+            if option['id'] in child_plans:
+                plan = child_plans[option['id']]
+                order = plan['kept'] + [child['id'] for child in created]
+                desired = self._sort_fields(options[option['value']], plan['existing'] + created)
+                stats['moved'] += self._move_custom_field_options(field, context, order, desired)
+                children = self._sort_options(desired, plan['existing'] + created)
+            result.extend({'id': child['id'], 'value': child['value'], 'optionId': option['id']} for child in children)
+        return stats, result
+
+    def _plan_custom_field_options(self, options, current):
+        wanted = set(options)
+        existing = [option for option in current if option['value'] in wanted]
+        existing_values = {option['value'] for option in existing}
+        removed = [option for option in current if option['value'] not in wanted]
+        added = [value for value in options if value not in existing_values]
+
+        # Options that only changed case are renamed instead of recreated
+        updates = [{'id': option['id'], 'disabled': False} for option in existing if option.get('disabled')]
+        renames = {}
+        for option in removed:
+            renames.setdefault(option['value'].lower(), option)
+        for value in list(added):
+            option = renames.pop(value.lower(), None)
+            if option is None:
+                continue
+            updates.append({'id': option['id'], 'value': value, 'disabled': False})
+            removed.remove(option)
+            added.remove(value)
+            existing.append(dict(option, value=value))
+
+        existing_ids = {option['id'] for option in existing}
+        kept = [option['id'] for option in current if option['id'] in existing_ids]
+        return {'existing': existing, 'kept': kept, 'added': added, 'removed': removed, 'updates': updates}
+
+    def _apply_custom_field_options_plans(self, field, context, plans, stats):
+        updates = [update for plan in plans for update in plan['updates']]
+        self._update_all_custom_field_options(field, context, updates)
+        stats['updated'] += len(updates)
+        for plan in plans:
+            removed = [option['id'] for option in plan['removed']]
+            self._delete_all_custom_field_options(field, context, removed)
+            stats['deleted'] += len(removed)
+
     def _delete_custom_field_options(self, field, context):
-        def get_total():
-            url = self._get_url(f'field/{field}/context/{context}/option')
-            response = json_loads(self._session.get(url))
-            return len(response['values'])
-
-        while get_total() > 0:
-            start_at = 0
-            parent_options = []
-            child_options = []
-            while True:
-                url = self._get_url(f'field/{field}/context/{context}/option?startAt={start_at}')
-                response = json_loads(self._session.get(url))
-                start_at += len(response['values'])
-                for option in response['values']:
-                    if 'optionId' not in option:
-                        parent_options.append(option['id'])
-                    else:
-                        child_options.append(option['id'])
-                if response['isLast']:
-                    break
-
-            def delete_worker(option):
-                tries = 1
-                while tries <= JIRA.REQUEST_MAX_RETRIES:
-                    try:
-                        option_url = self._get_url(f'field/{field}/context/{context}/option/{option}')
-                        self._session.delete(option_url)
-                        break
-                    except Exception as exc:
-                        tries += 1
-                        if tries > JIRA.REQUEST_MAX_RETRIES:
-                            raise exc from None
-                        time.sleep(JIRA.REQUEST_RETRY_INTERVAL)
-            with concurrent.futures.ThreadPoolExecutor(JIRA.REQUEST_WORKERS) as executor:
-                executor.map(delete_worker, child_options)
-            with concurrent.futures.ThreadPoolExecutor(JIRA.REQUEST_WORKERS) as executor:
-                executor.map(delete_worker, parent_options)
+        # Mirrored options are deleted without listing them, options are listed again while some remain
+        options = self._get_mirrored_custom_field_options(field, context)
+        self._invalidate_custom_field_options(field)
+        while True:
+            if options is None:
+                options = self._get_all_custom_field_options(field, context)
+            if not options:
+                break
+            child_options = [option['id'] for option in options if 'optionId' in option]
+            parent_options = [option['id'] for option in options if 'optionId' not in option]
+            self._delete_all_custom_field_options(field, context, child_options)
+            self._delete_all_custom_field_options(field, context, parent_options)
+            options = [] if self._count_custom_field_options(field, context) == 0 else None
+        self._store_custom_field_options(field, context, [])
+
+    def _get_all_custom_field_options(self, field, context):
+        start_at = 0
+        options = []
+        while True:
+            url = self._get_url(f'field/{field}/context/{context}/option?startAt={start_at}')
+            response = json_loads(self._call_custom_field_context(field, self._session.get, url))
+            start_at += len(response['values'])
+            options.extend(response['values'])
+            if response['isLast'] or not response['values']:
+                break
+        return options
+
+    def _delete_all_custom_field_options(self, field, context, option_ids):
+        def delete_worker(option):
+            option_url = self._get_url(f'field/{field}/context/{context}/option/{option}')
+            self._call_custom_field_context(field, self._session.delete, option_url)
+        with concurrent.futures.ThreadPoolExecutor(JIRA.REQUEST_WORKERS) as executor:
+            list(executor.map(delete_worker, option_ids))
+
+    def _update_all_custom_field_options(self, field, context, options):
+        url = self._get_url(f'field/{field}/context/{context}/option')
+        limit = JIRA.REQUEST_LIMIT
+        while options:
+            data = {'options': options[:limit]}
+            options = options[limit:]
+
+            self._call_custom_field_context(field, self._session.put, url, data=json.dumps(data))
 
     def _create_all_custom_field_options(self, field, context, options):
         url = self._get_url(f'field/{field}/context/{context}/option')
@@ -209,48 +551,73 @@ class JIRA(JIRABase):
             data = {'options': options[:limit]}
             options = options[limit:]
 
-            tries = 1
-            while tries <= JIRA.REQUEST_MAX_RETRIES:
-                try:
-                    result['options'].extend(json_loads(self._session.post(url, data=json.dumps(data)))['options'])
-                    break
-                except Exception as exc:
-                    tries += 1
-                    if tries > JIRA.REQUEST_MAX_RETRIES:
-                        raise exc from None
-                    time.sleep(JIRA.REQUEST_RETRY_INTERVAL)
+            response = self._call_custom_field_context(field, self._session.post, url, data=json.dumps(data))
+            result['options'].extend(json_loads(response)['options'])
         return result
 
-    def _reorder_all_custom_field_options(self, field, context, order):
+    def _move_custom_field_options(self, field, context, order, desired):
+        # Options in the longest subsequence that is already in the desired order stay in place
+        positions = {option_id: index for index, option_id in enumerate(order)}
+        sequence = [positions[option_id] for option_id in desired]
+        keep = {desired[index] for index in self._longest_increasing_subsequence(sequence)}
+
+        # Every run of misplaced options is moved right after the option that precedes it
+        moves, run, anchor, previous = [], [], None, None
+        for option_id in desired:
+            if option_id in keep:
+                if run:
+                    moves.append((anchor, run))
+                    run = []
+            else:
+                if not run:
+                    anchor = previous
+                run.append(option_id)
+            previous = option_id
+        if run:
+            moves.append((anchor, run))
+
+        for anchor, option_ids in moves:
+            self._move_all_custom_field_options(field, context, option_ids, anchor)
+        return sum(len(option_ids) for _, option_ids in moves)
+
+    def _move_all_custom_field_options(self, field, context, option_ids, after=None):
         url = self._get_url(f'field/{field}/context/{context}/option/move')
         limit = JIRA.REQUEST_LIMIT
-        while order:
-            data = {'position': 'Last', 'customFieldOptionIds': order[:limit]}
-            order = order[limit:]
-
-            tries = 1
-            while tries <= JIRA.REQUEST_MAX_RETRIES:
-                try:
-                    self._session.put(url, data=json.dumps(data))
-                    break
-                except Exception as exc:
-                    tries += 1
-                    if tries > JIRA.REQUEST_MAX_RETRIES:
-                        raise exc from None
-                    time.sleep(JIRA.REQUEST_RETRY_INTERVAL)
+        while option_ids:
+            data = {'customFieldOptionIds': option_ids[:limit]}
+            if after is None:
+                data['position'] = 'First'
+            else:
+                data['after'] = after
+            after = option_ids[:limit][-1]
+            option_ids = option_ids[limit:]
+
+            self._call_custom_field_context(field, self._session.put, url, data=json.dumps(data))
+
+    @staticmethod
+    def _longest_increasing_subsequence(sequence):
+        # Patience sorting, returns the indexes of one longest increasing subsequence
+        tails, tail_indexes, previous = [], [], [None] * len(sequence)
+        for index, value in enumerate(sequence):
+            position = bisect.bisect_left(tails, value)
+            if position == len(tails):
+                tails.append(value)
+                tail_indexes.append(index)
+            else:
+                tails[position] = value
+                tail_indexes[position] = index
+            previous[index] = tail_indexes[position - 1] if position else None
+        result = []
+        index = tail_indexes[-1] if tail_indexes else None
+        while index is not None:
+            result.append(index)
+            index = previous[index]
+        return result[::-1]
+
+    def _sort_options(self, option_ids, response):
+        options = {option['id']: option for option in response}
+        return [options[option_id] for option_id in option_ids]
 
     def _sort_fields(self, options, response):
         option_ids = {option['value']: option['id'] for option in response}
         return [option_ids[option] for option in options]
-
-    def _sort_fields_cascading(self, options, parents, children):
-        option_ids = {option['value']: {'id': option['id'], 'children': {}} for option in parents}
-        parent_names = {option['id']: option['value'] for option in parents}
-        parent_order = [option_ids[option]['id'] for option in options.keys()]
-        child_orders = []
-        for child in children:
-            option_ids[parent_names[child['optionId']]]['children'][child['value']] = child['id']
-        for parent, children in options.items():
-            children_ids = option_ids[parent]['children']
-            child_orders.append([children_ids[child] for child in children])
-        return parent_order, child_orders
@@ -1,7 +1,53 @@
+import contextlib
+import functools
+import json
+import threading
+import time
+
+import requests
+
+from pepper.exceptions import PepperException
 from pepper.libpepper import Pepper as PepperBase
 
 
 class Pepper(PepperBase):
+    # Request timeout of the calling thread, requests wait for the Salt master without one
+    _timeouts = threading.local()
+
+    @contextlib.contextmanager
+    def request_timeout(self, timeout):
+        previous = getattr(Pepper._timeouts, 'value', None)
+        Pepper._timeouts.value = timeout
+        try:
+            yield
+        finally:
+            Pepper._timeouts.value = previous
+
+    def req(self, path, data=None):
+        # Bounded requests are sent with requests since urllib is called without a timeout
+        timeout = getattr(Pepper._timeouts, 'value', None)
+        if timeout is None or self.auth.get('eauth') == 'kerberos':
+            return super().req(path, data)
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+        if path != '/run' and self.auth and self.auth.get('token'):
+            headers['X-Auth-Token'] = self.auth['token']
+        response = requests.request('GET' if data is None else 'POST', self._construct_url(path), headers=headers,
+                                    data=None if data is None else json.dumps(data), timeout=timeout,
+                                    verify=self._ssl_verify is True)
+        if response.status_code == 401:
+            raise PepperException('Authentication denied')
+        if response.status_code == 500:
+            raise PepperException('Server error.')
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError:
+            raise PepperException('Unable to parse the server response.')
+
     def local(self, tgt, fun, arg=None, kwarg=None, tgt_type='glob', timeout=None, ret=None):
         low = {
             'client': 'local',
@@ -38,6 +84,65 @@ class Pepper(PepperBase):
             low['ret'] = ret
         return self.low([low])
 
+    def local_async_list(self, tgt, fun, arg=None, kwarg=None, chunk_size=None, timeout=None, ret=None):
+        # Send one list-targeted lowstate per chunk of minions in a single request
+        tgt = list(tgt)
+        chunk_size = chunk_size or len(tgt) or 1
+        lows = []
+        for index in range(0, len(tgt), chunk_size):
+            low = {
+                'client': 'local_async',
+                'tgt': tgt[index:index + chunk_size],
+                'fun': fun,
+                'tgt_type': 'list',
+            }
+            if arg:
+                low['arg'] = arg
+            if kwarg:
+                low['kwarg'] = kwarg
+            if timeout:
+                low['timeout'] = timeout
+            if ret:
+                low['ret'] = ret
+            lows.append(low)
+        if not lows:
+            return {'return': []}
+        return self.low(lows)
+
+    def runner_list(self, fun, kwargs_list):
+        # Send one runner lowstate per set of keyword arguments in a single request
+        lows = []
+        for kwargs in kwargs_list:
+            low = {
+                'client': 'runner',
+                'fun': fun,
+            }
+            low.update(kwargs)
+            lows.append(low)
+        if not lows:
+            return {'return': []}
+        return self.low(lows)
+
+    def events(self, timeout=None):
+        # Read the server-sent events of the salt-api event bus, one dict with tag and data per event
+        headers = {'Accept': 'text/event-stream', 'X-Auth-Token': self.auth.get('token', '')}
+        response = requests.get(self.api_url.rstrip('/') + '/events', headers=headers, stream=True,
+                                timeout=timeout, verify=self._ssl_verify is True)
+        with response:
+            if response.status_code == 401:
+                raise PepperException('Authentication denied')
+            response.raise_for_status()
+            data = []
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    field, _, value = line.partition(':')
+                    if field == 'data':
+                        data.append(value[1:] if value.startswith(' ') else value)
+                    continue
+                if data:
+                    yield json.loads('\n'.join(data))
+                data = []
+
     def local_batch(self, tgt, fun, arg=None, kwarg=None, tgt_type='glob', batch='50%', ret=None):
         low = {
             'client': 'local_batch',
@@ -55,3 +160,58 @@ class Pepper(PepperBase):
         if ret:
             low['ret'] = ret
         return self.low([low])
+
+
+class PepperSession:
+    TOKEN_EXPIRY_MARGIN = 60
+    TOKEN_DEFAULT_LIFETIME = 43200
+
+    def __init__(self, api_url, username, password, eauth):
+        self.api_url = api_url
+        self._username = username
+        self._password = password
+        self._eauth = eauth
+        self._lock = threading.Lock()
+        self._pepper = None
+        self._expire = 0
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(Pepper, name, None)):
+            raise AttributeError(name)
+        return functools.partial(self._call, name)
+
+    def connect(self):
+        self._get_pepper()
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self._pepper = None
+            self._expire = 0
+
+    def _get_pepper(self, stale=None):
+        # Only one thread logs in at a time, the others reuse the new token
+        with self._lock:
+            expired = time.time() >= self._expire - PepperSession.TOKEN_EXPIRY_MARGIN
+            if self._pepper is None or self._pepper is stale or expired:
+                pepper = Pepper(self.api_url)
+                auth = pepper.login(self._username, self._password, self._eauth)
+                if not auth.get('token'):
+                    raise PepperException('Authentication denied')
+                # Use the token lifetime instead of the master clock to compute the expiry
+                lifetime = auth.get('expire', 0) - auth.get('start', 0)
+                lifetime = lifetime if lifetime > 0 else PepperSession.TOKEN_DEFAULT_LIFETIME
+                self._pepper = pepper
+                self._expire = time.time() + lifetime
+            return self._pepper
+
+    def _call(self, name, *args, **kwargs):
+        pepper = self._get_pepper()
+        try:
+            return getattr(pepper, name)(*args, **kwargs)
+        except PepperException as exc:
+            if 'Authentication denied' not in str(exc):
+                raise
+        # Token was revoked or expired on the master, login again and retry once
+        pepper = self._get_pepper(stale=pepper)
+        return getattr(pepper, name)(*args, **kwargs)
@@ -0,0 +1,219 @@
+import contextlib
+import logging
+import re
+import threading
+import time
+
+import psycopg2
+from psycopg2 import errors, extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+
+RE_QUERY_PARAMETER = re.compile(r'%s')
+
+log = logging.getLogger('Integration')
+
+
+class ConnectionPool(ThreadedConnectionPool):
+    CHECK_INTERVAL = 30
+    CHECK_QUERY = 'SELECT 1'
+
+    def __init__(self, minconn, maxconn, *args, timeout=None, check_interval=None, statements=None, **kwargs):
+        # Connections are opened on demand so the application can start before the database,
+        # psycopg2 closes returned connections once minconn are idle so up to maxconn are kept idle instead
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = self.maxconn
+        self.min_size = min(int(minconn), self.maxconn)
+        self.timeout = timeout
+        self.check_interval = ConnectionPool.CHECK_INTERVAL if check_interval is None else check_interval
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._statements = {}
+        self._prepared = {}
+        self._failed = {}
+        self._checked = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+        }
+        for name, query in (statements or {}).items():
+            self.register(name, query)
+        self.fill()
+
+    def register(self, name, query):
+        # Convert the query placeholders to the positional parameters used by PREPARE
+        count = 0
+
+        def replace(match):
+            nonlocal count
+            count += 1
+            return f'${count}'
+
+        prepare = f'PREPARE {name} AS {RE_QUERY_PARAMETER.sub(replace, query)}'
+        execute = f'EXECUTE {name}'
+        if count:
+            execute += ' (' + ', '.join(['%s'] * count) + ')'
+        self._statements[name] = (prepare, execute)
+        return execute
+
+    def statement(self, name):
+        return self._statements[name][1]
+
+    def getconn(self, key=None):
+        start = time.monotonic()
+        acquired = self._slots.acquire(blocking=False)
+        waited = not acquired
+        if not acquired:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['waits'] += int(waited)
+            self._stats['timeouts'] += int(not acquired)
+            self._stats['wait_time_total'] += elapsed
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], elapsed)
+        if not acquired:
+            raise PoolError('connection pool exhausted')
+
+        try:
+            for _ in range(self.maxconn + 1):
+                conn = super().getconn(key)
+                try:
+                    if self._check(conn):
+                        self._prepare(conn)
+                        return conn
+                except:
+                    super().putconn(conn, key, close=True)
+                    self._forget(conn)
+                    raise
+                with self._stats_lock:
+                    self._stats['connections_discarded'] += 1
+                super().putconn(conn, key, close=True)
+                self._forget(conn)
+            raise PoolError('no healthy connection available')
+        except:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            if conn.closed:
+                self._forget(conn)
+            self._slots.release()
+        self.fill()
+
+    def fill(self):
+        # Open connections up to the minimum size, returns False while the database is unreachable
+        while True:
+            with self._lock:
+                if self.closed or len(self._pool) + len(self._used) >= self.min_size:
+                    return True
+            try:
+                conn = psycopg2.connect(*self._args, **self._kwargs)
+                self._register(conn)
+                self._prepare(conn)
+            except:
+                log.warning('Postgres: Failed to open connection to reach the minimum pool size.', exc_info=True)
+                return False
+            with self._lock:
+                if self.closed or len(self._pool) + len(self._used) >= self.maxconn:
+                    conn.close()
+                    self._forget(conn)
+                    return True
+                self._pool.append(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._lock:
+            stats['in_use'] = len(self._used)
+            stats['idle'] = len(self._pool)
+        stats['min_size'] = self.min_size
+        stats['max_size'] = self.maxconn
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self._register(conn)
+        return conn
+
+    def _register(self, conn):
+        self._prepared[id(conn)] = set()
+        self._failed[id(conn)] = {}
+        self._checked[id(conn)] = time.monotonic()
+        with self._stats_lock:
+            self._stats['connections_created'] += 1
+
+    def _forget(self, conn):
+        self._prepared.pop(id(conn), None)
+        self._failed.pop(id(conn), None)
+        self._checked.pop(id(conn), None)
+
+    def _check(self, conn):
+        if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        now = time.monotonic()
+        if now - self._checked.get(id(conn), 0) < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(ConnectionPool.CHECK_QUERY)
+            conn.rollback()
+        except:
+            return False
+        self._checked[id(conn)] = now
+        return True
+
+    def _prepare(self, conn):
+        # Prepared statements live as long as the server session, prepare them once per connection
+        prepared = self._prepared.setdefault(id(conn), set())
+        failed = self._failed.setdefault(id(conn), {})
+        now = time.monotonic()
+        missing = [name for name in self._statements
+                   if name not in prepared and now - failed.get(name, -self.check_interval) >= self.check_interval]
+        if not missing:
+            return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('; '.join(self._statements[name][0] for name in missing))
+            conn.commit()
+            prepared.update(missing)
+            return
+        except psycopg2.DatabaseError:
+            conn.rollback()
+
+        # A statement that cannot be prepared, for example because of a missing table, only breaks its own callers,
+        # PREPARE is not transactional so the statements before the failing one of the batch already exist
+        for name in missing:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(self._statements[name][0])
+                conn.commit()
+                prepared.add(name)
+                failed.pop(name, None)
+            except errors.DuplicatePreparedStatement:
+                conn.rollback()
+                prepared.add(name)
+                failed.pop(name, None)
+            except psycopg2.DatabaseError as exc:
+                conn.rollback()
+                if name not in failed:
+                    log.error('Postgres: Failed to prepare statement %s: %s', name, str(exc).strip())
+                failed[name] = now
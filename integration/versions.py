@@ -0,0 +1,76 @@
+import functools
+import re
+
+
+CACHE_SIZE = 65536
+
+RE_DIGITS = re.compile(r'(\d+)')
+RE_DPKG_EPOCH = re.compile(r'^(\d+):(.*)$')
+RE_NUGET_PART = re.compile(r'^(\d*)(.*)$')
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def dpkg_key(version):
+    # Same ordering as dpkg --compare-versions: [epoch:]upstream[-revision]
+    epoch = 0
+    match = RE_DPKG_EPOCH.match(version)
+    if match:
+        epoch, version = int(match.group(1)), match.group(2)
+    upstream, separator, revision = version.rpartition('-')
+    if not separator:
+        upstream, revision = revision, ''
+    return epoch, _dpkg_part_key(upstream), _dpkg_part_key(revision)
+
+
+def _dpkg_part_key(part):
+    # Non-digit runs are compared character by character and digit runs numerically,
+    # every non-digit run ends with 0 so that a shorter run sorts after a tilde and before anything else
+    key = []
+    parts = RE_DIGITS.split(part)
+    for index in range(0, len(parts), 2):
+        if index and index == len(parts) - 1 and not parts[index]:
+            break
+        key.extend(_dpkg_order(char) for char in parts[index])
+        key.append(0)
+        key.append(int(parts[index + 1]) if index + 1 < len(parts) else 0)
+    key.append(0)
+    return tuple(key)
+
+
+def _dpkg_order(char):
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def nuget_key(version):
+    # Same ordering as NuGet and Chocolatey: release[-prerelease][+metadata]
+    version = version.strip().lower().split('+', 1)[0]
+    release, separator, prerelease = version.partition('-')
+    numbers, labels = [], []
+    for part in release.split('.'):
+        digits, rest = RE_NUGET_PART.match(part).groups()
+        numbers.append(int(digits) if digits else 0)
+        if rest:
+            labels.append(rest)
+    # Trailing zeros are not significant, 1.0 equals 1.0.0.0
+    while numbers and numbers[-1] == 0:
+        numbers.pop()
+    if separator:
+        labels.extend(prerelease.split('.'))
+    # Numeric labels sort before alphanumeric ones, a release sorts after all of its prereleases
+    labels = tuple((0, int(label), '') if label.isdigit() else (1, 0, label) for label in labels)
+    return tuple(numbers), int(not labels), labels
+
+
+SCHEMES = {
+    'dpkg': dpkg_key,
+    'nuget': nuget_key,
+}
+
+
+def sort_versions(versions, scheme, reverse=False):
+    return sorted(versions, key=SCHEMES[scheme], reverse=reverse)
@@ -0,0 +1,18 @@
+CREATE TABLE jobs (
+    id SERIAL PRIMARY KEY,
+    operation VARCHAR(16) NOT NULL,
+    itsm_id VARCHAR(64),
+    payload JSONB NOT NULL,
+    status VARCHAR(16) DEFAULT 'queued' NOT NULL,
+    stage VARCHAR(64),
+    result JSONB,
+    status_code INTEGER,
+    attempts INTEGER DEFAULT 0 NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    started_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX jobs_itsm_id_idx ON jobs (itsm_id);
+CREATE INDEX jobs_status_idx ON jobs (status, created_at);
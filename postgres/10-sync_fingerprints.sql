@@ -0,0 +1,5 @@
+CREATE TABLE sync_fingerprints (
+    stage VARCHAR(128) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
@@ -0,0 +1,12 @@
+CREATE TABLE sync_status (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    dirty BOOLEAN DEFAULT FALSE NOT NULL,
+    force BOOLEAN DEFAULT FALSE NOT NULL,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    last_success_at TIMESTAMP,
+    last_duration DOUBLE PRECISION,
+    last_result BOOLEAN
+);
+
+INSERT INTO sync_status (id) VALUES (1);
@@ -0,0 +1,113 @@
+CREATE TABLE effective_packages (
+    minion_id VARCHAR(64) NOT NULL,
+    package_name VARCHAR(128) NOT NULL,
+    package_version VARCHAR(128),
+    effective_after TIMESTAMP NOT NULL,
+    PRIMARY KEY (minion_id, package_name)
+);
+
+CREATE TABLE pending_effective_packages (
+    minion_id VARCHAR(64) NOT NULL,
+    package_name VARCHAR(128) NOT NULL,
+    after TIMESTAMP NOT NULL,
+    PRIMARY KEY (minion_id, package_name, after)
+);
+
+CREATE INDEX pending_effective_packages_after_idx ON pending_effective_packages (after);
+
+-- Recompute the effective version of the given minion and package pairs from their request history
+CREATE FUNCTION refresh_effective_packages(minion_ids VARCHAR[], package_names VARCHAR[]) RETURNS VOID AS $$
+BEGIN
+    -- Concurrent refreshes of the same pair wait for each other so the last one sees all committed requests,
+    -- the pair locks live in namespace 21003 apart from the application wide locks
+    PERFORM pg_advisory_xact_lock(21003, hashtext(keys.minion_id || '/' || keys.package_name))
+    FROM (SELECT DISTINCT * FROM unnest(minion_ids, package_names) AS keys (minion_id, package_name)) AS keys
+    ORDER BY hashtext(keys.minion_id || '/' || keys.package_name);
+
+    DELETE FROM effective_packages
+    USING unnest(minion_ids, package_names) AS keys (minion_id, package_name)
+    WHERE effective_packages.minion_id = keys.minion_id AND effective_packages.package_name = keys.package_name;
+
+    INSERT INTO effective_packages (minion_id, package_name, package_version, effective_after)
+    SELECT DISTINCT ON (install_packages.minion_id, install_packages.package_name)
+        install_packages.minion_id, install_packages.package_name, install_packages.package_version,
+        install_packages.after
+    FROM (SELECT DISTINCT * FROM unnest(minion_ids, package_names) AS keys (minion_id, package_name)) AS keys
+    JOIN install_packages
+    ON install_packages.minion_id = keys.minion_id AND install_packages.package_name = keys.package_name
+    WHERE install_packages.after <= NOW() AND install_packages.reverted = FALSE
+    ORDER BY install_packages.minion_id, install_packages.package_name, install_packages.after DESC,
+        install_packages.created_at DESC, install_packages.package_version DESC
+    ON CONFLICT (minion_id, package_name)
+    DO UPDATE SET package_version = EXCLUDED.package_version, effective_after = EXCLUDED.effective_after;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Refresh the pairs whose future-dated requests became due, returns the affected minions
+CREATE FUNCTION promote_effective_packages() RETURNS SETOF VARCHAR AS $$
+DECLARE
+    minion_ids VARCHAR[];
+    package_names VARCHAR[];
+BEGIN
+    WITH due AS (
+        DELETE FROM pending_effective_packages
+        WHERE after <= NOW()
+        RETURNING minion_id, package_name
+    )
+    SELECT array_agg(keys.minion_id), array_agg(keys.package_name)
+    INTO minion_ids, package_names
+    FROM (SELECT DISTINCT minion_id, package_name FROM due) AS keys;
+
+    PERFORM refresh_effective_packages(minion_ids, package_names);
+    RETURN QUERY SELECT DISTINCT minion_id FROM unnest(minion_ids) AS minion_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION install_packages_effective_packages() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO pending_effective_packages (minion_id, package_name, after)
+        SELECT minion_id, package_name, after
+        FROM new_rows
+        WHERE after > NOW() AND reverted = FALSE
+        ON CONFLICT DO NOTHING;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_effective_packages(array_agg(minion_id), array_agg(package_name))
+        FROM new_rows;
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_effective_packages(array_agg(minion_id), array_agg(package_name))
+        FROM (SELECT minion_id, package_name FROM old_rows UNION SELECT minion_id, package_name FROM new_rows) AS keys;
+    ELSE
+        PERFORM refresh_effective_packages(array_agg(minion_id), array_agg(package_name))
+        FROM old_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER install_packages_effective_packages_insert
+AFTER INSERT ON install_packages
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION install_packages_effective_packages();
+
+CREATE TRIGGER install_packages_effective_packages_update
+AFTER UPDATE ON install_packages
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION install_packages_effective_packages();
+
+CREATE TRIGGER install_packages_effective_packages_delete
+AFTER DELETE ON install_packages
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION install_packages_effective_packages();
+
+-- Backfill from existing requests
+INSERT INTO pending_effective_packages (minion_id, package_name, after)
+SELECT minion_id, package_name, after
+FROM install_packages
+WHERE after > NOW() AND reverted = FALSE
+ON CONFLICT DO NOTHING;
+
+SELECT refresh_effective_packages(array_agg(minion_id), array_agg(package_name))
+FROM (SELECT DISTINCT minion_id, package_name FROM install_packages) AS keys;
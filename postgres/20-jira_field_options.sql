@@ -0,0 +1,19 @@
+CREATE TABLE jira_field_contexts (
+    field_id VARCHAR(64) PRIMARY KEY,
+    context_id VARCHAR(64) NOT NULL,
+    option_count INTEGER,
+    updated_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
+
+CREATE TABLE jira_field_options (
+    field_id VARCHAR(64) NOT NULL,
+    context_id VARCHAR(64) NOT NULL,
+    option_id VARCHAR(64) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    parent_id VARCHAR(64),
+    position INTEGER NOT NULL,
+    disabled BOOLEAN DEFAULT FALSE NOT NULL,
+    PRIMARY KEY (field_id, option_id)
+);
+
+CREATE INDEX jira_field_options_position_idx ON jira_field_options (field_id, context_id, parent_id, position);
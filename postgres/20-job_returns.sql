@@ -0,0 +1,15 @@
+CREATE TABLE job_returns (
+    jid VARCHAR(20) NOT NULL,
+    minion_id VARCHAR(64) NOT NULL,
+    itsm_id VARCHAR(64) NOT NULL,
+    operation VARCHAR(16) NOT NULL,
+    status VARCHAR(16) DEFAULT 'pending' NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    returned_at TIMESTAMP,
+    finalized_at TIMESTAMP,
+    PRIMARY KEY (jid, minion_id, itsm_id)
+);
+
+CREATE INDEX job_returns_itsm_id_idx ON job_returns (itsm_id, status);
+CREATE INDEX job_returns_pending_idx ON job_returns (created_at) WHERE status = 'pending';
+CREATE INDEX job_returns_reboot_idx ON job_returns (minion_id) WHERE status = 'pending' AND operation = 'reboot';
@@ -0,0 +1,17 @@
+CREATE TABLE rollout_waves (
+    id SERIAL PRIMARY KEY,
+    job_id INTEGER,
+    itsm_id VARCHAR(64) NOT NULL,
+    operation VARCHAR(16) NOT NULL,
+    wave INTEGER NOT NULL,
+    minion_ids VARCHAR(64)[] NOT NULL,
+    status VARCHAR(16) DEFAULT 'pending' NOT NULL,
+    successes INTEGER,
+    failures INTEGER,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX rollout_waves_itsm_id_idx ON rollout_waves (itsm_id, wave);
+CREATE INDEX rollout_waves_job_id_idx ON rollout_waves (job_id);
@@ -0,0 +1,7 @@
+CREATE TABLE scheduled_runs (
+    minion_id VARCHAR(64) PRIMARY KEY,
+    attempts INTEGER DEFAULT 0 NOT NULL,
+    requested_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX scheduled_runs_requested_at_idx ON scheduled_runs (requested_at);